@@ -0,0 +1,123 @@
+"""Minimal in-process HTTP client for an ASGI app.
+
+Requests go straight through the app's middleware stack and routers without
+a socket or server, so the numbers reflect the application itself. The
+``lifespan`` context runs the app's startup and shutdown handlers.
+"""
+import asyncio
+import json
+from contextlib import asynccontextmanager
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlencode
+
+class Response:
+    def __init__(self, status: int, headers: Dict[str, str], body: bytes):
+        self.status = status
+        self.headers = headers
+        self.body = body
+
+    def json(self):
+        return json.loads(self.body)
+
+class ASGIClient:
+    def __init__(self, app, client: Tuple[str, int] = ("127.0.0.1", 50000)):
+        self.app = app
+        self.client = client
+
+    @asynccontextmanager
+    async def lifespan(self):
+        startup_done = asyncio.Event()
+        shutdown = asyncio.Event()
+        failure = []
+        messages = iter([{"type": "lifespan.startup"}])
+
+        async def receive():
+            message = next(messages, None)
+            if message is not None:
+                return message
+            await shutdown.wait()
+            return {"type": "lifespan.shutdown"}
+
+        async def send(message):
+            if message["type"].endswith(".failed"):
+                failure.append(message.get("message", ""))
+            if message["type"].startswith("lifespan.startup"):
+                startup_done.set()
+
+        task = asyncio.create_task(self.app({"type": "lifespan", "asgi": {"version": "3.0"}, "state": {}}, receive, send))
+        await startup_done.wait()
+        if failure:
+            raise RuntimeError(f"Application startup failed: {failure[0]}")
+        try:
+            yield self
+        finally:
+            shutdown.set()
+            await task
+
+    async def request(
+        self,
+        method: str,
+        path: str,
+        headers: Optional[Dict[str, str]] = None,
+        body: bytes = b"",
+        json_body=None,
+        form: Optional[Dict[str, str]] = None
+    ) -> Response:
+        headers = {key.lower(): value for key, value in (headers or {}).items()}
+        if json_body is not None:
+            body = json.dumps(json_body).encode()
+            headers.setdefault("content-type", "application/json")
+        elif form is not None:
+            body = urlencode(form).encode()
+            headers.setdefault("content-type", "application/x-www-form-urlencoded")
+        headers.setdefault("host", "benchmark")
+        headers["content-length"] = str(len(body))
+
+        path, _, query = path.partition("?")
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": method.upper(),
+            "scheme": "http",
+            "path": path,
+            "raw_path": path.encode(),
+            "query_string": query.encode(),
+            "root_path": "",
+            "headers": [(key.encode(), value.encode()) for key, value in headers.items()],
+            "client": self.client,
+            "server": ("benchmark", 80),
+            "state": {},
+        }
+
+        request_sent = False
+        response_done = asyncio.Event()
+        status = 500
+        response_headers: Dict[str, str] = {}
+        chunks = []
+
+        async def receive():
+            nonlocal request_sent
+            if not request_sent:
+                request_sent = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            await response_done.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                response_headers.update(
+                    (key.decode().lower(), value.decode()) for key, value in message.get("headers", [])
+                )
+            elif message["type"] == "http.response.body":
+                chunks.append(message.get("body", b""))
+                if not message.get("more_body", False):
+                    response_done.set()
+
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            response_done.set()
+        return Response(status, response_headers, b"".join(chunks))
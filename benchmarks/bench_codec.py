@@ -0,0 +1,59 @@
+"""Encode/decode cost per message type for each wire codec.
+
+Usage:
+    python -m benchmarks.bench_codec --iterations 100000
+"""
+import argparse
+import time
+
+from common.codec import get_codec
+
+HASH = "$2b$12$" + "x" * 53
+
+MESSAGES = {
+    "register_user": {
+        "action": "register_user",
+        "data": {"username": "ivanov", "password": HASH, "role": "user"},
+    },
+    "get_user_by_username": {
+        "action": "get_user_by_username",
+        "data": {"username": "ivanov", "password": "1234"},
+    },
+    "logout_user": {
+        "action": "logout_user",
+        "data": {"credentials": "eyJhbGciOiJIUzI1NiJ9." + "x" * 180 + "." + "y" * 43},
+    },
+    "user_reply": {"id": 42, "username": "ivanov", "password": HASH, "role": "user"},
+    "error_reply": {"error": "User with this username already exists"},
+}
+
+def timed(fn, arg, iterations: int) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn(arg)
+    return (time.perf_counter() - start) / iterations * 1e9
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=100000)
+    parser.add_argument("--codecs", nargs="+", default=["json", "orjson", "msgpack"])
+    args = parser.parse_args()
+
+    codecs = []
+    for name in args.codecs:
+        try:
+            codecs.append(get_codec(name))
+        except RuntimeError as e:
+            print(f"skipping {name}: {e}")
+
+    print(f"{'message':22} {'codec':8} {'bytes':>6} {'encode ns':>10} {'decode ns':>10}")
+    for message_type, message in MESSAGES.items():
+        for codec in codecs:
+            body = codec.encode(message)
+            assert codec.decode(body) == message
+            encode_ns = timed(codec.encode, message, args.iterations)
+            decode_ns = timed(codec.decode, body, args.iterations)
+            print(f"{message_type:22} {codec.name:8} {len(body):6} {encode_ns:10.0f} {decode_ns:10.0f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""Logging cost per login request before and after the queued, rate-limited setup.
+
+Usage:
+    python -m benchmarks.bench_logging --requests 20000
+
+Replays the log calls one login makes across the producer and the consumer,
+once as they were (eager f-strings, all at INFO, written synchronously by a
+basicConfig stream handler) and once as they are now (lazy %-formatting,
+chatter at DEBUG, a queue handler with the per-event rate limit). Output
+goes to a file so the writes are real. "caller us" is the time the event
+loop is blocked per request; "drained us" also waits for the listener
+thread to write everything out.
+"""
+import argparse
+import logging
+import os
+import tempfile
+import time
+
+from common.log import LOG_FORMAT, setup_logging, stop_logging
+
+USER = {"id": 42, "username": "alice", "password": "$2b$12$" + "x" * 53, "role": "user"}
+
+def legacy_request(logger: logging.Logger, i: int):
+    correlation_id = f"3f0b8c1e-{i:012d}"
+    username = USER["username"]
+    logger.info(f"Login attempt for user: {username}")
+    logger.info(f"Publishing message to user.login with correlation_id: {correlation_id}")
+    logger.info(f"Received message with correlation_id: {correlation_id}")
+    logger.info(f"Processing action: get_user_by_username with routing key: user.login")
+    logger.info("Processing login request...")
+    logger.info(f"Processing login request for user: {username}")
+    logger.info(f"User found: {USER}")
+    logger.info(f"Sending response to amq.gen-{i}")
+    logger.info(f"Response sent for correlation_id: {correlation_id}")
+    logger.info(f"Received response for correlation_id: {correlation_id}")
+    logger.info(f"Received response for correlation_id: {correlation_id}")
+    logger.info(f"User found in database: {USER}")
+    logger.info(f"Attempting to verify password for user: {username}")
+    logger.info(f"Successful login for user: {username}")
+
+def current_request(logger: logging.Logger, i: int):
+    correlation_id = f"3f0b8c1e-{i:012d}"
+    username = USER["username"]
+    logger.info("Login attempt for user: %s", username)
+    logger.debug("Publishing message to %s with correlation_id: %s", "user.login", correlation_id)
+    logger.debug("Received message with correlation_id: %s", correlation_id)
+    logger.info("Processing action: %s with routing key: %s", "get_user_by_username", "user.login")
+    logger.debug("Processing login request...")
+    logger.debug("Processing login request for user: %s", username)
+    logger.debug("User found: %s", USER["id"])
+    logger.debug("Sending response to %s", f"amq.gen-{i}")
+    logger.debug("Response sent for correlation_id: %s", correlation_id)
+    logger.debug("Received response for correlation_id: %s", correlation_id)
+    logger.debug("Received response for correlation_id: %s", correlation_id)
+    logger.debug("User %s found in database", USER["id"])
+    logger.debug("Attempting to verify password for user: %s", username)
+    logger.info("Successful login for user: %s", username)
+
+def legacy_setup(stream):
+    handler = logging.StreamHandler(stream)
+    handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    root = logging.getLogger()
+    root.setLevel(logging.INFO)
+    root.handlers[:] = [handler]
+
+def measure(name: str, request, configure, requests: int, path: str):
+    with open(path, "w") as stream:
+        configure(stream)
+        logger = logging.getLogger("bench")
+        start = time.perf_counter()
+        for i in range(requests):
+            request(logger, i)
+        caller = time.perf_counter() - start
+        stop_logging()
+        logging.getLogger().handlers[:] = []
+        drained = time.perf_counter() - start
+    size = os.path.getsize(path)
+    print(f"{name:<28}{caller / requests * 1e6:>12.2f}{drained / requests * 1e6:>12.2f}{size / requests:>14.0f}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--rate-limit", type=float, default=10.0, help="LOG_RATE_LIMIT_PER_SECOND")
+    args = parser.parse_args()
+
+    variants = [
+        ("before: sync, eager", legacy_request, legacy_setup),
+        ("before calls, queued", legacy_request, lambda s: setup_logging("INFO", 0, True, s)),
+        ("after, no rate limit", current_request, lambda s: setup_logging("INFO", 0, True, s)),
+        ("after", current_request, lambda s: setup_logging("INFO", args.rate_limit, True, s)),
+        ("after, LOG_LEVEL=WARNING", current_request, lambda s: setup_logging("WARNING", args.rate_limit, True, s)),
+    ]
+    print(f"{'variant':<28}{'caller us':>12}{'drained us':>12}{'bytes/request':>14}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, request, configure in variants:
+            measure(name, request, configure, args.requests, os.path.join(tmp, "bench.log"))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""Request latency of bcrypt verification at fixed concurrency per hashing mode.
+
+Usage:
+    python -m benchmarks.bench_password_hashing --concurrency 16 --requests 200
+
+Every simulated login awaits ``password_hasher.verify``; a probe task measures
+how long a trivial request (``/`` handler) waits for the event loop meanwhile.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import time
+
+os.environ.setdefault("SECRET_KEY", "benchmark")
+os.environ.setdefault("ALGORITHM", "HS256")
+
+from producer.utils.security import PasswordHasher, hash_password
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+async def run_mode(mode: str, workers: int, concurrency: int, requests: int, hashed: str):
+    hasher = PasswordHasher(mode, workers)
+    await hasher.verify("password", hashed)  # start the pool before timing
+    latencies, probe = [], []
+    queue = asyncio.Queue()
+    for _ in range(requests):
+        queue.put_nowait(None)
+
+    async def login_worker():
+        while not queue.empty():
+            queue.get_nowait()
+            start = time.perf_counter()
+            await asyncio.sleep(0)  # request accepted; other clients get to send theirs
+            await hasher.verify("password", hashed)
+            latencies.append(time.perf_counter() - start)
+
+    async def probe_worker(stop: asyncio.Event):
+        while not stop.is_set():
+            start = time.perf_counter()
+            await asyncio.sleep(0.001)
+            probe.append(time.perf_counter() - start - 0.001)
+
+    stop = asyncio.Event()
+    probe_task = asyncio.create_task(probe_worker(stop))
+    start = time.perf_counter()
+    await asyncio.gather(*(login_worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await probe_task
+    hasher.shutdown()
+
+    ms = lambda value: f"{value * 1000:8.1f}"
+    print(
+        f"{mode:8} {requests / elapsed:8.1f} req/s"
+        f"  login p50 {ms(percentile(latencies, 50))} p95 {ms(percentile(latencies, 95))}"
+        f" p99 {ms(percentile(latencies, 99))} ms"
+        f"  loop lag p99 {ms(percentile(probe, 99))} max {ms(max(probe))} ms"
+        f" mean {ms(statistics.mean(probe))} ms"
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 4)
+    parser.add_argument("--modes", nargs="+", default=list(PasswordHasher.MODES))
+    args = parser.parse_args()
+
+    hashed = hash_password("password")
+    print(f"concurrency={args.concurrency} requests={args.requests} workers={args.workers}")
+    for mode in args.modes:
+        asyncio.run(run_mode(mode, args.workers, args.concurrency, args.requests, hashed))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""RPC throughput of RabbitMQManager against an in-memory broker stand-in.
+
+Usage:
+    python -m benchmarks.bench_rpc_throughput --requests 20000 --concurrency 1000
+
+The stand-in replies to every request immediately (plus ``--latency`` per
+hop), so the numbers measure the producer's RPC client rather than RabbitMQ.
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+from unittest import mock
+
+os.environ.setdefault("SECRET_KEY", "benchmark")
+os.environ.setdefault("ALGORITHM", "HS256")
+
+import aio_pika
+
+from benchmarks.fake_broker import FakeBroker, echo_consumer
+from producer.core.rabbitmq import EXCHANGE_NAME, RabbitMQManager
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+async def run(args, publish_channels: int, callback_consumers: int):
+    broker = FakeBroker(latency=args.latency)
+    with mock.patch.object(aio_pika, "connect_robust", broker.connect):
+        manager = RabbitMQManager(
+            url="amqp://benchmark",
+            publish_channels=publish_channels,
+            callback_consumers=callback_consumers
+        )
+        await manager.connect()
+        await echo_consumer(
+            broker, EXCHANGE_NAME, "messages", ["user.login"],
+            lambda message: json.dumps({"id": 1, "username": "bench"}).encode()
+        )
+
+        latencies = []
+        remaining = iter(range(args.requests))
+
+        async def client():
+            for _ in remaining:
+                start = time.perf_counter()
+                await manager.publish_message(
+                    routing_key="user.login",
+                    message={"action": "get_user_by_username", "data": {"username": "bench"}}
+                )
+                latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(client() for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - start
+        leaked = len(manager.futures)
+        await manager.close()
+
+    print(
+        f"channels={publish_channels} consumers={callback_consumers}"
+        f"  {args.requests / elapsed:9.1f} rpc/s"
+        f"  p50 {percentile(latencies, 50) * 1000:7.2f} ms"
+        f"  p99 {percentile(latencies, 99) * 1000:7.2f} ms"
+        f"  pending after run: {leaked}"
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--concurrency", type=int, default=1000)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds per broker hop")
+    parser.add_argument("--channels", type=int, nargs="+", default=[1, 4])
+    parser.add_argument("--consumers", type=int, nargs="+", default=[1, 2])
+    args = parser.parse_args()
+
+    for channels in args.channels:
+        for consumers in args.consumers:
+            asyncio.run(run(args, channels, consumers))
+
+if __name__ == "__main__":
+    main()
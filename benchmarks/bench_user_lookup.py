@@ -0,0 +1,62 @@
+"""Per-lookup cost of the ORM user query versus the compiled Core projection.
+
+Usage:
+    python -m benchmarks.bench_user_lookup --users 10000 --lookups 20000
+
+Runs against a temporary SQLite database unless DATABASE_URL is set, so the
+numbers isolate Python-side query building and row materialisation.
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+if "DATABASE_URL" not in os.environ:
+    os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp()}/bench_user_lookup.db"
+
+from consumer.core import crud
+from consumer.core.db import SessionLocal, get_engine, init_db
+
+def orm_lookup(session, username):
+    user = crud._get_user_by_username(session, username)
+    return user.as_dict() if user else None
+
+def core_lookup(connection, username):
+    return crud._get_user_row_by_username(connection, username)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--lookups", type=int, default=20000)
+    args = parser.parse_args()
+
+    init_db()
+    with SessionLocal() as session:
+        if not session.query(crud.User).count():
+            for start in range(0, args.users, 1000):
+                crud._create_users(session, [
+                    {"username": f"user{i}", "password": "x" * 60, "role": "user"}
+                    for i in range(start, min(start + 1000, args.users))
+                ])
+
+    usernames = [f"user{random.randrange(args.users)}" for _ in range(args.lookups)]
+
+    with SessionLocal() as session:
+        start = time.perf_counter()
+        for username in usernames:
+            orm_lookup(session, username)
+            session.expunge_all()  # every message used a fresh session
+        orm = (time.perf_counter() - start) / args.lookups
+
+    with get_engine().connect() as connection:
+        start = time.perf_counter()
+        for username in usernames:
+            core_lookup(connection, username)
+        core = (time.perf_counter() - start) / args.lookups
+
+    print(f"ORM query + as_dict   {orm * 1e6:8.1f} us/lookup")
+    print(f"compiled Core row     {core * 1e6:8.1f} us/lookup  ({orm / core:.1f}x)")
+
+if __name__ == "__main__":
+    main()
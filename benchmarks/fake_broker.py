@@ -0,0 +1,44 @@
+"""In-memory broker for benchmarks, with simulated network latency.
+
+``FakeBroker.connect`` returns an aio-pika shaped connection from the
+producer's in-memory transport, so ``RabbitMQManager`` and the consumer can
+be driven without a RabbitMQ server. An optional per-hop ``latency``
+simulates the network.
+"""
+import asyncio
+from typing import Any, Callable
+
+from producer.core.transport import MemoryBroker
+
+class FakeBroker(MemoryBroker):
+    def __init__(self, latency: float = 0.0):
+        super().__init__()
+        self.latency = latency
+
+    async def deliver(self, exchange: str, message, routing_key: str) -> bool:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return await super().deliver(exchange, message, routing_key)
+
+async def echo_consumer(
+    broker: FakeBroker,
+    exchange_name: str,
+    queue_name: str,
+    routing_keys,
+    reply: Callable[[Any], bytes]
+):
+    """Binds ``queue_name`` and answers every request with ``reply(message)``."""
+    channel = await (await broker.connect()).channel()
+    queue = await channel.declare_queue(queue_name)
+    for key in routing_keys:
+        await queue.bind(exchange_name, routing_key=key)
+
+    async def handle(message):
+        from aio_pika import Message
+        async with message.process():
+            await channel.default_exchange.publish(
+                Message(body=reply(message), correlation_id=message.correlation_id),
+                routing_key=message.reply_to
+            )
+
+    await queue.consume(handle)
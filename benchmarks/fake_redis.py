@@ -0,0 +1,134 @@
+"""In-memory stand-in for the Redis commands this repository uses.
+
+``FakeRedis`` mirrors ``redis.asyncio.Redis`` and ``FakeSyncRedis`` mirrors
+``redis.Redis``; both can share one ``FakeRedisStore`` so that a token the
+consumer blacklists is seen by the producer. Values are stored as bytes and
+keys expire lazily, like a server configured with ``decode_responses=False``.
+"""
+import asyncio
+import fnmatch
+import time
+from typing import Dict, Optional, Tuple
+
+class FakeRedisStore:
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.data: Dict[bytes, Tuple[bytes, Optional[float]]] = {}
+        self.commands = 0
+
+    @staticmethod
+    def _bytes(value) -> bytes:
+        if isinstance(value, bytes):
+            return value
+        return str(value).encode()
+
+    def get(self, key) -> Optional[bytes]:
+        self.commands += 1
+        key = self._bytes(key)
+        entry = self.data.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at is not None and expires_at <= time.monotonic():
+            del self.data[key]
+            return None
+        return value
+
+    def set(self, key, value, ex: Optional[float] = None) -> bool:
+        self.commands += 1
+        expires_at = time.monotonic() + ex if ex else None
+        self.data[self._bytes(key)] = (self._bytes(value), expires_at)
+        return True
+
+    def exists(self, *keys) -> int:
+        return sum(self.get(key) is not None for key in keys)
+
+    def delete(self, *keys) -> int:
+        self.commands += 1
+        return sum(self.data.pop(self._bytes(key), None) is not None for key in keys)
+
+    def keys(self, match: str = "*"):
+        self.commands += 1
+        now = time.monotonic()
+        return [
+            key for key, (_, expires_at) in list(self.data.items())
+            if (expires_at is None or expires_at > now) and fnmatch.fnmatchcase(key.decode(), match)
+        ]
+
+class FakeRedis:
+    def __init__(self, store: FakeRedisStore = None):
+        self.store = store or FakeRedisStore()
+
+    async def _hop(self):
+        await asyncio.sleep(self.store.latency)
+
+    async def ping(self) -> bool:
+        await self._hop()
+        return True
+
+    async def get(self, key):
+        await self._hop()
+        return self.store.get(key)
+
+    async def set(self, key, value, ex=None):
+        await self._hop()
+        return self.store.set(key, value, ex)
+
+    async def setex(self, key, ttl, value):
+        await self._hop()
+        return self.store.set(key, value, ttl)
+
+    async def exists(self, *keys) -> int:
+        await self._hop()
+        return self.store.exists(*keys)
+
+    async def delete(self, *keys) -> int:
+        await self._hop()
+        return self.store.delete(*keys)
+
+    async def scan_iter(self, match: str = "*", count: int = None):
+        await self._hop()
+        for key in self.store.keys(match):
+            yield key
+
+    async def aclose(self):
+        pass
+
+class FakeSyncRedis:
+    def __init__(self, store: FakeRedisStore = None):
+        self.store = store or FakeRedisStore()
+
+    def _hop(self):
+        if self.store.latency:
+            time.sleep(self.store.latency)
+
+    def ping(self) -> bool:
+        self._hop()
+        return True
+
+    def get(self, key):
+        self._hop()
+        return self.store.get(key)
+
+    def set(self, key, value, ex=None):
+        self._hop()
+        return self.store.set(key, value, ex)
+
+    def setex(self, key, ttl, value):
+        self._hop()
+        return self.store.set(key, value, ttl)
+
+    def exists(self, *keys) -> int:
+        self._hop()
+        return self.store.exists(*keys)
+
+    def delete(self, *keys) -> int:
+        self._hop()
+        return self.store.delete(*keys)
+
+    def scan_iter(self, match: str = "*", count: int = None):
+        self._hop()
+        return iter(self.store.keys(match))
+
+    def close(self):
+        pass
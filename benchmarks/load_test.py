@@ -0,0 +1,381 @@
+"""End-to-end load test of the producer app and consumer against local stand-ins.
+
+Usage:
+    python -m benchmarks.load_test --requests 5000 --concurrency 50
+    python -m benchmarks.load_test --duration 30 --mix register=1,login=2,protected=10,logout=1
+    python -m benchmarks.load_test --output results/baseline.json
+    python -m benchmarks.load_test --compare results/baseline.json --max-regression 10
+    python -m benchmarks.load_test --replay traffic.ndjson --replay-speed 1
+
+``producer.main:app`` is driven in-process through its full middleware stack
+and ``consumer.consume.main`` handles the RPCs. RabbitMQ and Redis are
+replaced by the in-memory stand-ins in this package and the database is a
+temporary SQLite file unless DATABASE_URL is set (e.g. to a local Postgres).
+Every other setting is read from the environment as usual, so the effect of
+e.g. PASSWORD_HASH_MODE or WIRE_CODEC can be compared run against run.
+
+The traffic mix picks one of these per request, by weight:
+    register   POST /auth/register with a new user
+    login      POST /auth/login as a registered user
+    protected  GET / with a bearer token from an earlier login
+    logout     POST /auth/logout, retiring that token
+
+Replay files hold one JSON object per line:
+    {"method": "POST", "path": "/auth/login", "form": {...}, "at": 0.25}
+with optional "headers", "json", "form" or raw "body" and an "at" offset in
+seconds from the start. "{token}", "{username}" and "{password}" in the path,
+header values and body fields are replaced with a seeded user's values.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import tempfile
+import time
+from collections import Counter, defaultdict
+from contextlib import ExitStack, suppress
+from datetime import datetime, timezone
+from unittest import mock
+
+_workdir = tempfile.mkdtemp(prefix="load_test-")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{_workdir}/load_test.db")
+os.environ.setdefault("SECRET_KEY", "benchmark")
+os.environ.setdefault("ALGORITHM", "HS256")
+os.environ.setdefault("CONSUMER_METRICS_DIR", f"{_workdir}/metrics")
+
+import aio_pika
+
+import consumer.consume as consume
+import consumer.utils.redis as consumer_redis
+import producer.utils.redis as producer_redis
+from benchmarks.asgi_client import ASGIClient
+from benchmarks.fake_broker import FakeBroker
+from benchmarks.fake_redis import FakeRedis, FakeRedisStore, FakeSyncRedis
+from common.log import setup_logging
+from consumer.core import crud
+from consumer.core.db import SessionLocal, init_db
+from producer.main import app
+from producer.utils.security import create_access_token, get_password_hasher
+
+DEFAULT_MIX = "register=1,login=3,protected=10,logout=1"
+PASSWORD = "benchmark-password"
+# Tuning settings recorded with the results; never credentials or URLs
+TUNING_ENV = (
+    "PASSWORD_HASH_MODE", "PASSWORD_HASH_WORKERS", "BCRYPT_ROUNDS", "PASSWORD_REHASH_ON_LOGIN",
+    "WIRE_CODEC", "TRANSPORT", "QUEUE_LAYOUT",
+    "RABBITMQ_PUBLISH_CHANNELS", "RABBITMQ_CALLBACK_CONSUMERS", "RABBITMQ_DIRECT_REPLY_TO",
+    "RPC_TIMEOUT_SECONDS", "RPC_COALESCING", "RPC_MAX_IN_FLIGHT", "RPC_SHED_QUEUE_DEPTH", "RPC_BREAKER_ENABLED",
+    "CONSUMER_WORKERS", "CONSUMER_CONCURRENCY", "CONSUMER_PREFETCH",
+    "LOGIN_CONCURRENCY", "LOGIN_PREFETCH", "LOGOUT_CONCURRENCY", "LOGOUT_PREFETCH",
+    "REGISTER_CONCURRENCY", "REGISTER_PREFETCH", "REGISTER_BATCH_SIZE", "REGISTER_BATCH_WINDOW_MS",
+    "USER_CACHE_SIZE", "USER_CACHE_TTL_SECONDS", "USER_CACHE_NEGATIVE_TTL_SECONDS", "USER_CACHE_REDIS",
+    "DB_POOL_SIZE", "DB_MAX_OVERFLOW", "DB_POOL_PRE_PING", "DB_POOL_RECYCLE", "DB_POOL_PREWARM",
+    "TOKEN_CACHE_SIZE", "TOKEN_CACHE_TTL_SECONDS",
+    "BLACKLIST_FILTER_ENABLED", "BLACKLIST_FILTER_CAPACITY", "BLACKLIST_SYNC_INTERVAL_SECONDS",
+    "LOGOUT_MODE", "LOGOUT_AUDIT_EVENTS", "LOG_LEVEL", "LOG_QUEUE", "LOG_RATE_LIMIT_PER_SECOND",
+)
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+def parse_mix(value: str) -> dict:
+    mix = {}
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        if name not in Scenario.OPERATIONS:
+            raise argparse.ArgumentTypeError(f"unknown operation {name!r}, expected one of {', '.join(Scenario.OPERATIONS)}")
+        mix[name] = float(weight or 1)
+    return mix
+
+class Recorder:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(Counter)
+
+    def record(self, endpoint: str, status, seconds: float):
+        self.latencies[endpoint].append(seconds)
+        self.statuses[endpoint][str(status)] += 1
+
+    def summary(self, elapsed: float) -> dict:
+        def stats(latencies, statuses):
+            errors = sum(count for status, count in statuses.items() if not status.startswith(("2", "3")))
+            return {
+                "requests": len(latencies),
+                "errors": errors,
+                "throughput": len(latencies) / elapsed if elapsed else 0.0,
+                "p50_ms": percentile(latencies, 50) * 1000,
+                "p95_ms": percentile(latencies, 95) * 1000,
+                "p99_ms": percentile(latencies, 99) * 1000,
+                "max_ms": max(latencies) * 1000,
+                "statuses": dict(statuses),
+            }
+
+        endpoints = {
+            endpoint: stats(latencies, self.statuses[endpoint])
+            for endpoint, latencies in sorted(self.latencies.items())
+        }
+        everything = [sample for latencies in self.latencies.values() for sample in latencies]
+        total = sum(self.statuses.values(), Counter())
+        return {
+            "elapsed_seconds": elapsed,
+            "total": stats(everything, total) if everything else {},
+            "endpoints": endpoints,
+        }
+
+async def timed(client: ASGIClient, recorder: Recorder, endpoint: str, method: str, path: str, **kwargs):
+    start = time.perf_counter()
+    try:
+        response = await client.request(method, path, **kwargs)
+        status = response.status
+    except Exception:
+        # the app re-raises after its error middleware answered with a 500
+        response, status = None, "exception"
+    recorder.record(endpoint, status, time.perf_counter() - start)
+    return response
+
+class Scenario:
+    """Weighted random mix of register, login, protected and logout requests."""
+    OPERATIONS = ("register", "login", "protected", "logout")
+
+    def __init__(self, client: ASGIClient, recorder: Recorder, mix: dict, usernames, rng: random.Random):
+        self.client = client
+        self.recorder = recorder
+        self.names = list(mix)
+        self.weights = [mix[name] for name in self.names]
+        self.usernames = list(usernames)
+        self.tokens = []
+        self.rng = rng
+        self._registered = 0
+
+    async def step(self):
+        operation = self.rng.choices(self.names, self.weights)[0]
+        # Fall back to whatever the chosen request depends on
+        if operation in ("protected", "logout") and not self.tokens:
+            operation = "login"
+        if operation == "login" and not self.usernames:
+            operation = "register"
+        await getattr(self, operation)()
+
+    async def register(self):
+        self._registered += 1
+        username = f"load-{os.getpid()}-{self._registered}"
+        response = await timed(
+            self.client, self.recorder, "POST /auth/register", "POST", "/auth/register",
+            json_body={"username": username, "password": PASSWORD, "role": "user"}
+        )
+        if response is not None and response.status == 200:
+            self.usernames.append(username)
+
+    async def login(self):
+        response = await timed(
+            self.client, self.recorder, "POST /auth/login", "POST", "/auth/login",
+            form={"username": self.rng.choice(self.usernames), "password": PASSWORD}
+        )
+        if response is not None and response.status == 200:
+            self.tokens.append(response.json()["access_token"])
+
+    async def protected(self):
+        await timed(
+            self.client, self.recorder, "GET /", "GET", "/",
+            headers={"Authorization": f"Bearer {self.rng.choice(self.tokens)}"}
+        )
+
+    async def logout(self):
+        token = self.tokens.pop(self.rng.randrange(len(self.tokens)))
+        await timed(
+            self.client, self.recorder, "POST /auth/logout", "POST", "/auth/logout",
+            headers={"Authorization": f"Bearer {token}"}
+        )
+
+def _substitute(value, values: dict):
+    if isinstance(value, str):
+        for name, replacement in values.items():
+            value = value.replace("{" + name + "}", replacement)
+        return value
+    if isinstance(value, dict):
+        return {key: _substitute(item, values) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_substitute(item, values) for item in value]
+    return value
+
+def load_replay(path: str) -> list:
+    with open(path) as f:
+        entries = [json.loads(line) for line in f if line.strip()]
+    return sorted(entries, key=lambda entry: entry.get("at", 0))
+
+async def replay(client: ASGIClient, recorder: Recorder, entries: list, seeded: list, concurrency: int, speed: float, rng):
+    queue: asyncio.Queue = asyncio.Queue()
+    for entry in entries:
+        queue.put_nowait(entry)
+    start = time.perf_counter()
+
+    async def worker():
+        while not queue.empty():
+            entry = queue.get_nowait()
+            if speed > 0 and "at" in entry:
+                delay = entry["at"] / speed - (time.perf_counter() - start)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            username, token = rng.choice(seeded)
+            entry = _substitute(entry, {"token": token, "username": username, "password": PASSWORD})
+            method = entry.get("method", "GET").upper()
+            path = entry["path"]
+            body = entry.get("body", "")
+            await timed(
+                client, recorder, f"{method} {path.partition('?')[0]}", method, path,
+                headers=entry.get("headers"),
+                body=body.encode() if isinstance(body, str) else body,
+                json_body=entry.get("json"),
+                form=entry.get("form")
+            )
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+
+async def seed_users(count: int) -> list:
+    """Inserts ``count`` users directly and returns (username, access token) pairs."""
+    hashed = await get_password_hasher().hash(PASSWORD)
+    usernames = [f"seed-{i}" for i in range(count)]
+    with SessionLocal() as session:
+        for start in range(0, count, 500):
+            crud._create_users(session, [
+                {"username": username, "password": hashed, "role": "user"}
+                for username in usernames[start:start + 500]
+            ])
+    seeded = []
+    with SessionLocal() as session:
+        for username in usernames:
+            user = crud._get_user_by_username(session, username)
+            seeded.append((username, create_access_token({"sub": str(user.id), "role": user.role})))
+    return seeded
+
+
+async def run(args) -> dict:
+    broker = FakeBroker(latency=args.broker_latency)
+    store = FakeRedisStore(latency=args.redis_latency)
+
+    with ExitStack() as stack:
+        stack.enter_context(mock.patch.object(aio_pika, "connect_robust", broker.connect))
+        stack.enter_context(mock.patch.object(consume, "connect_robust", broker.connect))
+        stack.enter_context(producer_redis.redis_resource.override(FakeRedis(store)))
+        stack.enter_context(consumer_redis.redis_resource.override(FakeSyncRedis(store)))
+        stack.enter_context(consumer_redis.async_redis_resource.override(FakeRedis(store)))
+
+        init_db()
+        consumer_ready = asyncio.Event()
+        consumer_task = asyncio.create_task(consume.main(ready=consumer_ready))
+        await consumer_ready.wait()
+
+        client = ASGIClient(app)
+        recorder = Recorder()
+        rng = random.Random(args.seed)
+        async with client.lifespan():
+            seeded = await seed_users(args.seed_users)
+            start = time.perf_counter()
+            if args.replay:
+                await replay(client, recorder, load_replay(args.replay), seeded, args.concurrency, args.replay_speed, rng)
+            else:
+                scenario = Scenario(client, recorder, args.mix, [username for username, _ in seeded], rng)
+                scenario.tokens.extend(token for _, token in seeded[:args.concurrency])
+                deadline = start + args.duration if args.duration else None
+                # a deadline ends the run instead of the request count
+                remaining = iter(int, 1) if deadline is not None else iter(range(args.requests))
+
+                async def user():
+                    for _ in remaining:
+                        if deadline is not None and time.perf_counter() >= deadline:
+                            break
+                        await scenario.step()
+
+                await asyncio.gather(*(user() for _ in range(args.concurrency)))
+            elapsed = time.perf_counter() - start
+
+        consumer_task.cancel()
+        with suppress(asyncio.CancelledError):
+            await consumer_task
+
+    results = recorder.summary(elapsed)
+    results["started_at"] = datetime.now(timezone.utc).isoformat()
+    results["config"] = {
+        "mode": "replay" if args.replay else "mix",
+        "mix": None if args.replay else args.mix,
+        "replay": args.replay,
+        "requests": args.requests,
+        "duration": args.duration,
+        "concurrency": args.concurrency,
+        "broker_latency": args.broker_latency,
+        "redis_latency": args.redis_latency,
+        "database": os.environ["DATABASE_URL"].split(":", 1)[0],
+        "env": {name: os.environ[name] for name in TUNING_ENV if name in os.environ},
+    }
+    return results
+
+def print_results(results: dict):
+    print(f"{'endpoint':<22}{'requests':>10}{'errors':>8}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    rows = list(results["endpoints"].items())
+    if results["total"]:
+        rows.append(("total", results["total"]))
+    for endpoint, stats in rows:
+        print(
+            f"{endpoint:<22}{stats['requests']:>10}{stats['errors']:>8}{stats['throughput']:>10.1f}"
+            f"{stats['p50_ms']:>10.2f}{stats['p95_ms']:>10.2f}{stats['p99_ms']:>10.2f}"
+        )
+
+def compare(results: dict, baseline: dict, max_regression: float = None) -> bool:
+    """Prints the change against ``baseline``; False if a regression exceeds the limit."""
+    ok = True
+    print(f"\n{'vs baseline':<22}{'req/s':>12}{'p50':>10}{'p99':>10}")
+    current = dict(results["endpoints"], total=results["total"])
+    previous = dict(baseline["endpoints"], total=baseline["total"])
+    for endpoint, stats in current.items():
+        before = previous.get(endpoint)
+        if not before or not stats:
+            continue
+
+        def change(key):
+            return (stats[key] - before[key]) / before[key] * 100 if before[key] else 0.0
+
+        throughput, p50, p99 = change("throughput"), change("p50_ms"), change("p99_ms")
+        flag = ""
+        if max_regression is not None and (throughput < -max_regression or p99 > max_regression):
+            flag, ok = "  REGRESSION", False
+        print(f"{endpoint:<22}{throughput:>+11.1f}%{p50:>+9.1f}%{p99:>+9.1f}%{flag}")
+    return ok
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--duration", type=float, default=None, help="seconds; overrides --requests")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix(DEFAULT_MIX), help=f"default {DEFAULT_MIX}")
+    parser.add_argument("--replay", help="NDJSON request log to replay instead of the mix")
+    parser.add_argument("--replay-speed", type=float, default=0.0, help="1 follows the log's timing, 0 sends as fast as possible")
+    parser.add_argument("--seed-users", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--broker-latency", type=float, default=0.0, help="seconds per broker hop")
+    parser.add_argument("--redis-latency", type=float, default=0.0, help="seconds per Redis command")
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument("--compare", help="results JSON of an earlier run")
+    parser.add_argument("--max-regression", type=float, default=None, help="percent; exit 1 when exceeded")
+    parser.add_argument("--log-level", default="WARNING")
+    args = parser.parse_args()
+
+    # Before the app starts: its startup hook then finds logging configured and keeps this level
+    setup_logging(args.log_level)
+    results = asyncio.run(run(args))
+    print_results(results)
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            if not compare(results, json.load(f), args.max_regression):
+                raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
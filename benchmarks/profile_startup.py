@@ -0,0 +1,94 @@
+"""Cold-start profile of a service: import time per module, then resource warm-up.
+
+Usage:
+    python -m benchmarks.profile_startup --service producer
+    python -m benchmarks.profile_startup --service consumer --top 30
+
+Imports are timed in a fresh interpreter with ``python -X importtime``: the
+slowest modules by cumulative time, then the total per top-level package.
+This process then imports the service and warms its resources as the
+startup hook does, reporting the time of each, or why it failed (e.g. no
+broker reachable from this machine). Run it with the service's environment.
+"""
+import argparse
+import asyncio
+import importlib
+import os
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from typing import List, Tuple
+
+ENTRY_POINTS = {"producer": "producer.main", "consumer": "consumer.consume"}
+
+def import_times(module: str) -> List[Tuple[int, int, str]]:
+    """(self us, cumulative us, module) for every module imported by ``module``."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        env=os.environ
+    )
+    if result.returncode != 0:
+        sys.exit(f"Importing {module} failed:\n{result.stderr[-2000:]}")
+    times = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        times.append((int(self_us), int(cumulative_us), name.rstrip()))
+    return times
+
+def print_imports(times: List[Tuple[int, int, str]], top: int):
+    print(f"{'cumulative ms':>14}{'self ms':>10}  module")
+    for self_us, cumulative_us, name in sorted(times, key=lambda t: -t[1])[:top]:
+        print(f"{cumulative_us / 1000:>14.1f}{self_us / 1000:>10.1f}  {name}")
+
+    packages = defaultdict(int)
+    for self_us, _, name in times:
+        packages[name.strip().split(".")[0]] += self_us
+    print(f"\n{'total ms':>14}  package")
+    for package, self_us in sorted(packages.items(), key=lambda item: -item[1])[:top]:
+        print(f"{self_us / 1000:>14.1f}  {package}")
+    print(f"{sum(packages.values()) / 1000:>14.1f}  (all imports)")
+
+async def warm_up(resources, timeout: float):
+    try:
+        await asyncio.wait_for(resources.warm_up(strict=False), timeout)
+    except asyncio.TimeoutError:
+        print(f"warm-up did not finish within {timeout:.0f}s")
+    finally:
+        await resources.close()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--service", choices=sorted(ENTRY_POINTS), default="producer")
+    parser.add_argument("--top", type=int, default=20)
+    parser.add_argument("--timeout", type=float, default=10.0, help="seconds allowed for the warm-up")
+    args = parser.parse_args()
+    module = ENTRY_POINTS[args.service]
+
+    print(f"Imports of {module} (fresh interpreter)\n")
+    print_imports(import_times(module), args.top)
+
+    start = time.perf_counter()
+    importlib.import_module(module)
+    imported = time.perf_counter() - start
+    resources = importlib.import_module(f"{args.service}.core.resources").resources
+
+    start = time.perf_counter()
+    asyncio.run(warm_up(resources, args.timeout))
+    warmed = time.perf_counter() - start
+
+    print(f"\nStartup of {module}\n")
+    print(f"{'ms':>14}  step")
+    print(f"{imported * 1000:>14.1f}  import")
+    for name, status in resources.status().items():
+        seconds = status["seconds"]
+        outcome = "ok" if status["error"] is None and seconds is not None else status["error"] or "not warmed"
+        print(f"{(seconds or 0) * 1000:>14.1f}  warm {name}: {outcome}")
+    print(f"{warmed * 1000:>14.1f}  warm-up (resources in parallel)")
+
+if __name__ == "__main__":
+    main()
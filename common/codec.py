@@ -0,0 +1,106 @@
+import json
+from abc import ABC, abstractmethod
+from typing import Any, Dict, Optional
+
+JSON_CONTENT_TYPE = "application/json"
+MSGPACK_CONTENT_TYPE = "application/msgpack"
+
+class DecodeError(ValueError):
+    """Message body could not be decoded"""
+
+class Codec(ABC):
+    name: str
+    content_type: str
+    content_encoding: Optional[str] = None
+
+    @abstractmethod
+    def encode(self, obj: Any) -> bytes:
+        ...
+
+    @abstractmethod
+    def decode(self, body: bytes) -> Any:
+        ...
+
+class JsonCodec(Codec):
+    name = "json"
+    content_type = JSON_CONTENT_TYPE
+    content_encoding = "utf-8"
+
+    def encode(self, obj: Any) -> bytes:
+        return json.dumps(obj).encode()
+
+    def decode(self, body: bytes) -> Any:
+        try:
+            return json.loads(body.decode())
+        except ValueError as e:
+            raise DecodeError(str(e)) from e
+
+class OrjsonCodec(Codec):
+    name = "orjson"
+    content_type = JSON_CONTENT_TYPE
+    content_encoding = "utf-8"
+
+    def __init__(self):
+        import orjson
+        self._orjson = orjson
+
+    def encode(self, obj: Any) -> bytes:
+        return self._orjson.dumps(obj)
+
+    def decode(self, body: bytes) -> Any:
+        try:
+            return self._orjson.loads(body)
+        except ValueError as e:
+            raise DecodeError(str(e)) from e
+
+class MsgpackCodec(Codec):
+    name = "msgpack"
+    content_type = MSGPACK_CONTENT_TYPE
+
+    def __init__(self):
+        import msgpack
+        self._msgpack = msgpack
+
+    def encode(self, obj: Any) -> bytes:
+        return self._msgpack.packb(obj)
+
+    def decode(self, body: bytes) -> Any:
+        try:
+            return self._msgpack.unpackb(body)
+        except Exception as e:
+            raise DecodeError(str(e)) from e
+
+_CODEC_CLASSES = {codec.name: codec for codec in (JsonCodec, OrjsonCodec, MsgpackCodec)}
+_codecs: Dict[str, Codec] = {}
+
+def get_codec(name: str) -> Codec:
+    """Returns the codec used to encode outgoing messages."""
+    codec = _codecs.get(name)
+    if codec is None:
+        if name not in _CODEC_CLASSES:
+            raise ValueError(f"Unknown wire codec: {name}")
+        try:
+            codec = _codecs[name] = _CODEC_CLASSES[name]()
+        except ImportError as e:
+            raise RuntimeError(f"Wire codec {name} requires the {e.name} package") from e
+    return codec
+
+def _fastest_json() -> Codec:
+    try:
+        return get_codec("orjson")
+    except RuntimeError:
+        return get_codec("json")
+
+def codec_for(content_type: Optional[str], content_encoding: Optional[str] = None) -> Codec:
+    """Returns the codec that decodes a message with the given AMQP properties.
+
+    Messages without a content type are treated as JSON, which is what
+    senders produced before codecs were negotiated.
+    """
+    if content_encoding not in (None, "", "utf-8", "binary"):
+        raise DecodeError(f"Unsupported content encoding: {content_encoding}")
+    if content_type in (None, "", JSON_CONTENT_TYPE):
+        return _fastest_json()
+    if content_type == MSGPACK_CONTENT_TYPE:
+        return get_codec("msgpack")
+    raise DecodeError(f"Unsupported content type: {content_type}")
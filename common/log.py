@@ -0,0 +1,116 @@
+"""Logging that keeps handler I/O off the event loop.
+
+``setup_logging`` gives the root logger a single queue handler: a log call
+only builds the record and enqueues it, while a listener thread formats it
+and writes it to stderr. Records at INFO and below are rate limited per
+event (logger plus format string), so lines logged for every message cannot
+flood the output under load; warnings and errors always go through.
+"""
+import atexit
+import logging
+import queue
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener
+from typing import IO, Dict, List, Optional, Tuple
+
+# Same layout as logging.basicConfig
+LOG_FORMAT = "%(levelname)s:%(name)s:%(message)s"
+# Distinct events tracked by the rate limiter before it starts over
+MAX_TRACKED_EVENTS = 1000
+
+class RateLimitFilter(logging.Filter):
+    """Token bucket per event: ``rate`` records a second, bursts of up to ``burst``."""
+    def __init__(self, rate: float, burst: Optional[float] = None, max_level: int = logging.INFO):
+        super().__init__()
+        self.rate = rate
+        self.burst = burst or max(1.0, rate)
+        self.max_level = max_level
+        self.suppressed = 0
+        self._buckets: Dict[Tuple[str, str], List[float]] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > self.max_level:
+            return True
+        key = (record.name, str(record.msg))
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                if len(self._buckets) >= MAX_TRACKED_EVENTS:
+                    self._buckets.clear()
+                bucket = self._buckets[key] = [self.burst, now]
+            tokens = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+            if tokens < 1:
+                bucket[0] = tokens
+                self.suppressed += 1
+                return False
+            bucket[0] = tokens - 1
+            return True
+
+class LocalQueueHandler(QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Records never leave the process, so formatting is left to the listener thread
+        return record
+
+_listener: Optional[QueueListener] = None
+_handler: Optional[logging.Handler] = None
+_rate_limit: Optional[RateLimitFilter] = None
+
+def setup_logging(
+    level: str = "INFO",
+    rate_limit: float = 10.0,
+    queued: bool = True,
+    stream: Optional[IO[str]] = None
+) -> logging.Handler:
+    """Configures the root logger once; later calls return the same handler.
+
+    ``rate_limit`` is the records per second let through for each INFO or
+    DEBUG event, 0 disables it. ``queued=False`` writes from the caller.
+    Output goes to ``stream``, stderr by default.
+    """
+    global _listener, _handler, _rate_limit
+    if _handler is not None:
+        return _handler
+
+    writer = logging.StreamHandler(stream)
+    writer.setFormatter(logging.Formatter(LOG_FORMAT))
+    if queued:
+        records = queue.SimpleQueue()
+        handler = LocalQueueHandler(records)
+        _listener = QueueListener(records, writer)
+        _listener.start()
+        atexit.register(stop_logging)
+    else:
+        handler = writer
+    if rate_limit > 0:
+        _rate_limit = RateLimitFilter(rate_limit)
+        handler.addFilter(_rate_limit)
+
+    # LOG_FORMAT shows none of these, so records skip looking them up
+    logging.logThreads = False
+    logging.logProcesses = False
+    logging.logMultiprocessing = False
+
+    root = logging.getLogger()
+    root.setLevel(level.upper())
+    root.handlers[:] = [handler]
+    _handler = handler
+    return handler
+
+def suppressed_records() -> int:
+    """Records dropped by the rate limit since logging was set up."""
+    return _rate_limit.suppressed if _rate_limit is not None else 0
+
+def stop_logging():
+    """Writes out the records still queued and stops the listener thread."""
+    global _listener, _handler, _rate_limit
+    if _handler is not None:
+        logging.getLogger().removeHandler(_handler)
+        _handler = None
+        _rate_limit = None
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -0,0 +1,152 @@
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+# Seconds; covers sub-millisecond cache hits up to the RPC timeout
+DEFAULT_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0
+)
+
+class Metric:
+    type = ""
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = (), aggregate: str = "sum"):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        # How snapshots of several processes combine: "sum", or "max" for values they all observe
+        self.aggregate = aggregate
+        self._function: Optional[Callable[[], object]] = None
+        self._series: Dict[Tuple[str, ...], object] = {}
+
+    def set_function(self, function: Callable[[], object]):
+        """Reads the value at scrape time: a number, or a dict of label tuples to numbers."""
+        self._function = function
+
+    def series(self) -> List[list]:
+        if self._function is not None:
+            value = self._function()
+            if isinstance(value, dict):
+                return [[list(labels), float(v)] for labels, v in value.items()]
+            return [[[], float(value)]]
+        return [[list(labels), value] for labels, value in self._series.items()]
+
+    def snapshot(self) -> dict:
+        return {
+            "type": self.type,
+            "help": self.help,
+            "labelnames": list(self.labelnames),
+            "aggregate": self.aggregate,
+            "series": self.series(),
+        }
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, amount: float = 1, *labels: str):
+        self._series[labels] = self._series.get(labels, 0) + amount
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def set(self, value: float, *labels: str):
+        self._series[labels] = value
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = (), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, *labels: str):
+        series = self._series.get(labels)
+        if series is None:
+            # per-bucket counts (last one is +Inf), sum, count
+            series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def snapshot(self) -> dict:
+        snapshot = super().snapshot()
+        snapshot["buckets"] = list(self.buckets)
+        return snapshot
+
+class Registry:
+    def __init__(self):
+        self.metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labelnames: Iterable[str] = ()) -> Counter:
+        return self.register(Counter(name, help, labelnames))
+
+    def gauge(self, name: str, help: str, labelnames: Iterable[str] = (), aggregate: str = "sum") -> Gauge:
+        return self.register(Gauge(name, help, labelnames, aggregate))
+
+    def histogram(self, name: str, help: str, labelnames: Iterable[str] = (), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help, labelnames, buckets))
+
+    def snapshot(self) -> Dict[str, dict]:
+        return {name: metric.snapshot() for name, metric in self.metrics.items()}
+
+    def render(self) -> str:
+        return render_snapshots([self.snapshot()])
+
+def merge_snapshots(snapshots: Iterable[Dict[str, dict]]) -> Dict[str, dict]:
+    """Adds up the series of several snapshots, e.g. one per worker process."""
+    merged: Dict[str, dict] = {}
+    for snapshot in snapshots:
+        for name, metric in snapshot.items():
+            target = merged.setdefault(name, {**metric, "series": {}})
+            for labels, value in metric["series"]:
+                key = tuple(labels)
+                current = target["series"].get(key)
+                if current is None:
+                    # Copy histogram state so merging never touches live series
+                    target["series"][key] = [list(value[0]), value[1], value[2]] if metric["type"] == "histogram" else value
+                elif metric["type"] == "histogram":
+                    current[0] = [a + b for a, b in zip(current[0], value[0])]
+                    current[1] += value[1]
+                    current[2] += value[2]
+                elif metric.get("aggregate") == "max":
+                    target["series"][key] = max(current, value)
+                else:
+                    target["series"][key] = current + value
+    for metric in merged.values():
+        metric["series"] = [[list(labels), value] for labels, value in metric["series"].items()]
+    return merged
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _labels(names, values, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def render_snapshots(snapshots: Iterable[Dict[str, dict]]) -> str:
+    """Renders snapshots in the Prometheus text exposition format."""
+    lines = []
+    for name, metric in merge_snapshots(snapshots).items():
+        lines.append(f"# HELP {name} {metric['help']}")
+        lines.append(f"# TYPE {name} {metric['type']}")
+        names = metric["labelnames"]
+        for labels, value in metric["series"]:
+            if metric["type"] != "histogram":
+                lines.append(f"{name}{_labels(names, labels)} {value}")
+                continue
+            counts, total, count = value
+            cumulative = 0
+            for bound, bucket_count in zip(list(metric["buckets"]) + ["+Inf"], counts):
+                cumulative += bucket_count
+                le = 'le="' + str(bound) + '"'
+                lines.append(f"{name}_bucket{_labels(names, labels, le)} {cumulative}")
+            lines.append(f"{name}_sum{_labels(names, labels)} {total}")
+            lines.append(f"{name}_count{_labels(names, labels)} {count}")
+    return "\n".join(lines) + "\n"
+
@@ -0,0 +1,130 @@
+"""Clients a service needs, created on first use and warmed before it reports ready.
+
+Nothing connects at import time. A resource's factory runs the first time
+``get`` is called, and ``warm_up`` (called from the startup hook) creates the
+resources and opens their first connections, so the first requests do not
+pay for it. ``override`` swaps in another instance, e.g. a fake in benchmarks.
+Each service keeps its own registry, so co-located services never share one.
+"""
+import asyncio
+import inspect
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+class Resource:
+    def __init__(
+        self,
+        name: str,
+        factory: Callable[[], Any],
+        warm: Optional[Callable[[Any], Any]] = None,
+        close: Optional[Callable[[Any], Any]] = None,
+        required: bool = False
+    ):
+        self.name = name
+        self.factory = factory
+        self._warm = warm
+        self._close = close
+        # A required resource that fails to warm up fails the startup
+        self.required = required
+        self.warmed = False
+        self.error: Optional[str] = None
+        self.init_seconds: Optional[float] = None
+        self._instance = None
+        self._lock = threading.Lock()
+
+    @property
+    def created(self) -> bool:
+        return self._instance is not None
+
+    def get(self) -> Any:
+        instance = self._instance
+        if instance is None:
+            with self._lock:
+                if self._instance is None:
+                    self._instance = self.factory()
+                instance = self._instance
+        return instance
+
+    @contextmanager
+    def override(self, instance: Any):
+        previous, self._instance = self._instance, instance
+        try:
+            yield instance
+        finally:
+            self._instance = previous
+
+    async def warm(self):
+        start = time.perf_counter()
+        try:
+            instance = self.get()
+            if self._warm is not None:
+                # Blocking warm-ups (sync drivers) run in a thread to keep the loop free
+                if inspect.iscoroutinefunction(self._warm):
+                    await self._warm(instance)
+                else:
+                    await asyncio.to_thread(self._warm, instance)
+        except Exception as e:
+            self.warmed = False
+            self.error = str(e)
+            raise
+        finally:
+            self.init_seconds = time.perf_counter() - start
+        self.warmed = True
+        self.error = None
+
+    async def close(self):
+        instance, self._instance = self._instance, None
+        self.warmed = False
+        if instance is not None and self._close is not None:
+            result = self._close(instance)
+            if inspect.isawaitable(result):
+                await result
+
+    def status(self) -> Dict[str, Any]:
+        return {"created": self.created, "warmed": self.warmed, "seconds": self.init_seconds, "error": self.error}
+
+class ResourceRegistry:
+    def __init__(self):
+        self.resources: Dict[str, Resource] = {}
+
+    def add(self, name: str, factory: Callable[[], Any], **kwargs) -> Resource:
+        resource = self.resources[name] = Resource(name, factory, **kwargs)
+        return resource
+
+    def __getitem__(self, name: str) -> Resource:
+        return self.resources[name]
+
+    @property
+    def ready(self) -> bool:
+        return all(resource.warmed for resource in self.resources.values())
+
+    async def warm_up(self, names: Optional[Iterable[str]] = None, strict: bool = True) -> bool:
+        """Warms the resources not warmed yet, concurrently; returns whether all of them are.
+
+        With ``strict``, a failing required resource raises; other failures are
+        logged and left for the next call (e.g. from the readiness probe).
+        """
+        selected = [self.resources[name] for name in names] if names is not None else list(self.resources.values())
+        pending = [resource for resource in selected if not resource.warmed]
+        results = await asyncio.gather(*(resource.warm() for resource in pending), return_exceptions=True)
+        for resource, result in zip(pending, results):
+            if isinstance(result, Exception):
+                if strict and resource.required:
+                    raise result
+                logger.error("Error warming up %s: %s", resource.name, result)
+        return all(resource.warmed for resource in selected)
+
+    async def close(self):
+        for resource in reversed(list(self.resources.values())):
+            try:
+                await resource.close()
+            except Exception as e:
+                logger.error("Error closing %s: %s", resource.name, e)
+
+    def status(self) -> Dict[str, Dict[str, Any]]:
+        return {name: resource.status() for name, resource in self.resources.items()}
@@ -1,8 +1,10 @@
 import asyncio
-import json
 import logging
 import os
-from typing import Dict, Any
+import signal
+import time
+from contextlib import nullcontext
+from typing import Awaitable, Callable, Dict, Any, List, Optional
 
 from aio_pika import (
     connect,
@@ -12,13 +14,31 @@ from aio_pika import (
     Exchange,
     ExchangeType
 )
+from aio_pika.exceptions import ChannelNotFoundEntity
 
-from consumer.core.models import User
-from consumer.core.db import get_db
-from consumer.core.crud import create_user, get_user_by_username, get_user_by_id
-from consumer.utils.redis import blacklist_token
+from common.cache import TTLCache
+from common.codec import DecodeError, codec_for, get_codec
+from consumer.core.crud import create_users, get_user_row_by_username, update_password_hash
+from consumer.core.batching import MicroBatcher
+from consumer.core.db import pool_stats
+from consumer.core.dispatcher import Dispatcher
+from consumer.core.log import setup_logging, suppressed_records
+from consumer.core.resources import resources
+from consumer.core.metrics import (
+    db_pool,
+    expired_messages,
+    export_snapshots,
+    in_flight,
+    log_suppressed,
+    message_duration,
+    queue_depth,
+    queue_wait,
+    user_cache_lookups,
+    workers_ready
+)
+from consumer.utils.cache import UserCache
+from consumer.utils.redis import blacklist_token, get_async_redis
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 host = os.getenv("RABBITMQ_HOST", "rabbitmq")
@@ -27,40 +47,112 @@ user = os.getenv("RABBITMQ_DEFAULT_USER", "guest")
 password = os.getenv("RABBITMQ_DEFAULT_PASS", "guest")
 RABBITMQ_URL = f"amqp://{user}:{password}@{host}:{port}/"
 EXCHANGE_NAME = os.getenv("EXCHANGE_NAME", "default_exchange")
+DIRECT_REPLY_TO = "amq.rabbitmq.reply-to"
+DEADLINE_HEADER = "x-deadline"
+SENT_AT_HEADER = "x-sent-at"
+
+# Concurrent dispatch: number of messages handled at once and the broker prefetch
+CONSUMER_CONCURRENCY = int(os.getenv("CONSUMER_CONCURRENCY", "16"))
+CONSUMER_PREFETCH = int(os.getenv("CONSUMER_PREFETCH", str(CONSUMER_CONCURRENCY)))
+# Per-action caps inside the pool (0 means limited only by CONSUMER_CONCURRENCY)
+ACTION_CONCURRENCY = {
+    "register_user": int(os.getenv("REGISTER_CONCURRENCY", "0")),
+    "get_user_by_username": int(os.getenv("LOGIN_CONCURRENCY", "0")),
+    "logout_user": int(os.getenv("LOGOUT_CONCURRENCY", "0")),
+}
+# Queue layout: "per_action" consumes one queue per routing key, each with its own
+# prefetch and concurrency (the caps above, or CONSUMER_CONCURRENCY when 0);
+# "shared" consumes every routing key from the single legacy queue
+QUEUE_LAYOUT = os.getenv("QUEUE_LAYOUT", "per_action")
+SHARED_QUEUE = "messages"
+ROUTING_KEYS = {
+    "user.register": "register_user",
+    "user.login": "get_user_by_username",
+    "user.logout": "logout_user",
+}
+QUEUE_PREFETCH = {
+    "user.register": int(os.getenv("REGISTER_PREFETCH", "0")),
+    "user.login": int(os.getenv("LOGIN_PREFETCH", "0")),
+    "user.logout": int(os.getenv("LOGOUT_PREFETCH", "0")),
+}
+# Highest message priority honoured by the per-action queues (0 disables). A
+# per-action queue holds one action, so this only puts background work such as
+# password rehashes (priority 0) behind interactive requests of that action.
+# The legacy shared queue keeps its original declaration, without priorities, so
+# brokers that already have it can still drain it. RabbitMQ cannot change this
+# on an existing queue; delete the queue first.
+QUEUE_MAX_PRIORITY = int(os.getenv("QUEUE_MAX_PRIORITY", "10"))
+QUEUE_DEPTH_INTERVAL = float(os.getenv("QUEUE_DEPTH_INTERVAL", "5"))
+# Registration micro-batching: flush after this many messages (at most the register
+# lane's concurrency and prefetch) or this many milliseconds
+REGISTER_BATCH_SIZE = int(os.getenv("REGISTER_BATCH_SIZE", "50"))
+REGISTER_BATCH_WINDOW_MS = float(os.getenv("REGISTER_BATCH_WINDOW_MS", "5"))
+# Read-through user cache: in-process LRU plus an optional shared Redis tier
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "10000"))
+USER_CACHE_TTL_SECONDS = float(os.getenv("USER_CACHE_TTL_SECONDS", "60"))
+USER_CACHE_NEGATIVE_TTL_SECONDS = float(os.getenv("USER_CACHE_NEGATIVE_TTL_SECONDS", "5"))
+USER_CACHE_REDIS = os.getenv("USER_CACHE_REDIS", "false").lower() == "true"
+USER_CACHE_REDIS_TTL_SECONDS = float(os.getenv("USER_CACHE_REDIS_TTL_SECONDS", "300"))
+
+# The shared Redis tier is attached when the consumer starts
+user_cache = UserCache(
+    TTLCache(USER_CACHE_SIZE, USER_CACHE_TTL_SECONDS),
+    USER_CACHE_NEGATIVE_TTL_SECONDS,
+    redis_ttl=USER_CACHE_REDIS_TTL_SECONDS
+)
+
+async def write_registrations(batch: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    users = [
+        {
+            "username": user_data["username"],
+            "password": user_data["password"],
+            "role": user_data.get("role"),
+        }
+        for user_data in batch
+    ]
+    created = await create_users(users)
+    responses = []
+    for user, user_id in zip(users, created):
+        if user_id is None:
+            responses.append({"error": "User with this username already exists"})
+            continue
+        # Prime the cache; this also replaces any cached "not found" entry
+        await user_cache.set(user["username"], {"id": user_id, **user})
+        responses.append({"success": "User registered successfully"})
+    return responses
+
+def register_batch_limit() -> int:
+    """Registrations that can wait in one batch: each holds a dispatch slot and an unacked delivery."""
+    slots = ACTION_CONCURRENCY["register_user"] or CONSUMER_CONCURRENCY
+    prefetch = CONSUMER_PREFETCH if QUEUE_LAYOUT == "shared" else QUEUE_PREFETCH["user.register"] or slots
+    return max(1, min(REGISTER_BATCH_SIZE, slots, prefetch))
+
+# A larger batch could never fill up and would always wait out the window
+register_batcher = MicroBatcher(write_registrations, register_batch_limit(), REGISTER_BATCH_WINDOW_MS / 1000)
 
 async def process_register(message: Dict[str, Any]):
-    db_gen = get_db()
-    db = next(db_gen)
-    user_data = message["data"]
-    try:
-        existing_user = await get_user_by_username(db, user_data["username"])
-        if existing_user:
-            return {"error": "User with this username already exists"}
-        new_user = User(
-            username=user_data["username"],
-            password=user_data["password"],
-            role=user_data.get("role"),
-        )
-        await create_user(db, new_user)
-    finally:
-        db.close()
-    return {"success": "User registered successfully"}
+    return await register_batcher.submit(message["data"])
 
 async def process_login(message: Dict[str, Any]) -> Dict[str, Any]:
-    db_gen = get_db()
-    db = next(db_gen)
     username = message["data"]["username"]
-    try:
-        logger.info(f"Processing login request for user: {username}")
-        existing_user = await get_user_by_username(db, username)
-        if existing_user:
-            logger.info(f"User found in database: {existing_user.as_dict()}")
-            return existing_user.as_dict()
-        else:
-            logger.error(f"User not found: {username}")
-            return {"error": "User not found"} 
-    finally:
-        db.close()
+    logger.debug("Processing login request for user: %s", username)
+    existing_user = await user_cache.get(username, get_user_row_by_username)
+    if existing_user:
+        logger.debug("User found: %s", existing_user["id"])
+        return existing_user
+    else:
+        # Routine (typos, probing) and rate limited at INFO; the producer answers the client
+        logger.info("User not found: %s", username)
+        return {"error": "User not found"}
+
+async def process_update_password_hash(message: Dict[str, Any]):
+    data = message["data"]
+    if await update_password_hash(data["id"], data["old_hash"], data["new_hash"]):
+        await user_cache.invalidate(data["username"])
+        logger.info("Password hash updated for user: %s", data["username"])
+    else:
+        logger.info("Password hash of user %s changed meanwhile, rehash skipped", data["username"])
+    return {}
 
 async def process_logout(message: Dict[str, Any]):
     token = message["data"]["credentials"]
@@ -70,54 +162,96 @@ async def process_logout(message: Dict[str, Any]):
     except Exception as e:
         return {"error": str(e)}
 
-async def process_message(message: IncomingMessage, exchange: Exchange):
+async def process_logout_event(message: Dict[str, Any]):
+    data = message["data"]
+    logger.info("User %s logged out (jti: %s)", data.get("sub"), data.get("jti"))
+    return {}
+
+def skip_expired(message: IncomingMessage) -> bool:
+    """Counts and reports a request the producer has already stopped waiting for."""
+    deadline = (message.headers or {}).get(DEADLINE_HEADER)
+    if deadline is None or time.time() < float(deadline):
+        return False
+    expired_messages.inc()
+    logger.warning("Skipping expired message with correlation_id: %s", message.correlation_id)
+    return True
+
+def reply_exchange(message: IncomingMessage, exchange: Exchange) -> Exchange:
+    # Direct reply-to pseudo-queues are only reachable through the default exchange
+    if message.reply_to.startswith(DIRECT_REPLY_TO):
+        return exchange.channel.default_exchange
+    return exchange
+
+async def process_message(message: IncomingMessage, exchange: Exchange, dispatcher: Optional[Dispatcher] = None):
     try:
         async with message.process():
-            logger.info(f"Received message with correlation_id: {message.correlation_id}")
-            request_data = json.loads(message.body.decode())
+            logger.debug("Received message with correlation_id: %s", message.correlation_id)
+            if skip_expired(message):
+                return
+
+            start = time.perf_counter()
+            codec = codec_for(message.content_type, message.content_encoding)
+            request_data = codec.decode(message.body)
             action = request_data.get("action")
             response = {}
 
+            sent_at = (message.headers or {}).get(SENT_AT_HEADER)
+            if sent_at is not None:
+                queue_wait.observe(max(0.0, time.time() - float(sent_at)), str(action))
+
             # Log the received action and routing key
-            logger.info(f"Processing action: {action} with routing key: {message.routing_key}")
+            logger.info("Processing action: %s with routing key: %s", action, message.routing_key)
 
             # Request processing
-            match action:
-                case "register_user":
-                    logger.info("Processing register request...")
-                    response = await process_register(request_data)
-                case "get_user_by_username":
-                    logger.info("Processing login request...")
-                    response = await process_login(request_data)
-                case "logout_user":
-                    logger.info("Processing user logout...")
-                    response = await process_logout(request_data)
-                case _:
-                    logger.warning(f"Unknown action received: {action}")
-                    response = {"error": f"Unknown action: {action}"}
+            async with (dispatcher.action_slot(action) if dispatcher else nullcontext()):
+                # Waiting for an action slot may have outlived the deadline
+                if skip_expired(message):
+                    return
+
+                match action:
+                    case "register_user":
+                        logger.debug("Processing register request...")
+                        response = await process_register(request_data)
+                    case "get_user_by_username":
+                        logger.debug("Processing login request...")
+                        response = await process_login(request_data)
+                    case "logout_user":
+                        logger.debug("Processing user logout...")
+                        response = await process_logout(request_data)
+                    case "logout_event":
+                        response = await process_logout_event(request_data)
+                    case "update_password_hash":
+                        response = await process_update_password_hash(request_data)
+                    case _:
+                        logger.warning("Unknown action received: %s", action)
+                        response = {"error": f"Unknown action: {action}"}
 
 
             if message.reply_to:
-                logger.info(f"Sending response to {message.reply_to}")
+                logger.debug("Sending response to %s", message.reply_to)
+                # Reply in the request's format so mixed versions interoperate
                 response_message = Message(
-                    body=json.dumps(response).encode(),
+                    body=codec.encode(response),
+                    content_type=codec.content_type,
+                    content_encoding=codec.content_encoding,
                     correlation_id=message.correlation_id
                 )
-                await exchange.publish(
+                await reply_exchange(message, exchange).publish(
                     response_message,
                     routing_key=message.reply_to
                 )
-                logger.info(f"Response sent for correlation_id: {message.correlation_id}")
-            else:
+                logger.debug("Response sent for correlation_id: %s", message.correlation_id)
+            elif response:
                 logger.warning("No reply_to in message, response not sent")
+            message_duration.observe(time.perf_counter() - start, str(action))
 
-    except json.JSONDecodeError as e:
-        logger.error(f"Invalid JSON in message: {e}")
+    except DecodeError as e:
+        logger.error("Invalid message body: %s", e)
         if not message.processed:
             await message.reject(requeue=False)
         await send_error_response(message, exchange, "Invalid message format")
     except Exception as e:
-        logger.error(f"Error processing message: {e}")
+        logger.error("Error processing message: %s", e)
         if not message.processed:
             await message.reject(requeue=False)
         await send_error_response(message, exchange, str(e))
@@ -125,57 +259,199 @@ async def process_message(message: IncomingMessage, exchange: Exchange):
 async def send_error_response(message: IncomingMessage, exchange: Exchange, error_msg: str):
     if message.reply_to:
         error_response = {"error": error_msg}
+        try:
+            codec = codec_for(message.content_type, message.content_encoding)
+        except DecodeError:
+            codec = get_codec("json")
         error_message = Message(
-            body=json.dumps(error_response).encode(),
+            body=codec.encode(error_response),
+            content_type=codec.content_type,
+            content_encoding=codec.content_encoding,
             correlation_id=message.correlation_id
         )
         try:
-            await exchange.publish(
+            await reply_exchange(message, exchange).publish(
                 error_message,
                 routing_key=message.reply_to
             )
-            logger.error(f"Error response sent for correlation_id: {message.correlation_id}")
+            logger.error("Error response sent for correlation_id: %s", message.correlation_id)
         except Exception as e:
-            logger.error(f"Failed to send error response: {e}")
+            logger.error("Failed to send error response: %s", e)
 
-async def main():
-    connection = await connect_robust(RABBITMQ_URL)
-    async with connection:
-        channel = await connection.channel()
-        await channel.set_qos(prefetch_count=1)
+class Lane:
+    """A queue consumed on its own channel, with its own prefetch and dispatcher."""
+    def __init__(
+        self,
+        name: str,
+        routing_keys: List[str],
+        dispatcher: Dispatcher,
+        prefetch: int,
+        arguments: Optional[Dict[str, Any]] = None
+    ):
+        self.name = name
+        self.routing_keys = routing_keys
+        self.dispatcher = dispatcher
+        self.prefetch = prefetch
+        self.arguments = arguments
+        self.channel = None
+        self.exchange: Optional[Exchange] = None
+        self.queue = None
+
+    async def declare(self, connection):
+        self.channel = await connection.channel()
+        await self.channel.set_qos(prefetch_count=self.prefetch)
 
-        exchange = await channel.declare_exchange(
+        self.exchange = await self.channel.declare_exchange(
             EXCHANGE_NAME,
             ExchangeType.DIRECT,
             durable=True
         )
 
-        queue = await channel.declare_queue(
-            "messages",
+        self.queue = await self.channel.declare_queue(
+            self.name,
             durable=True,
-            auto_delete=False
+            auto_delete=False,
+            arguments=self.arguments
         )
-       
-        routing_keys = [
-            "user.register",
-            "user.login",
-            "user.logout",
-        ]
-        
-        for key in routing_keys:
-            await queue.bind(exchange, routing_key=key)
-            logger.info(f"Queue bound to exchange with routing key: {key}")
-
-        async with queue.iterator() as queue_iter:
-            message: IncomingMessage
-            async for message in queue_iter:
-                await process_message(message, exchange)
+
+        for key in self.routing_keys:
+            await self.queue.bind(self.exchange, routing_key=key)
+            logger.info("Queue %s bound to exchange with routing key: %s", self.name, key)
+
+    async def consume(self):
+        try:
+            async with self.queue.iterator() as queue_iter:
+                message: IncomingMessage
+                async for message in queue_iter:
+                    # Each handler acks its own delivery tag once its reply is
+                    # published, so completion order does not matter
+                    await self.dispatcher.submit(message, self.exchange, self.dispatcher)
+        finally:
+            await self.dispatcher.drain()
+
+    async def depth(self, channel) -> int:
+        # Never on the consuming channel: a failed passive declare closes its channel
+        queue = await channel.declare_queue(self.name, passive=True)
+        return queue.declaration_result.message_count
+
+def build_lanes() -> List[Lane]:
+    if QUEUE_LAYOUT == "shared":
+        return [Lane(
+            SHARED_QUEUE,
+            list(ROUTING_KEYS),
+            Dispatcher(process_message, CONSUMER_CONCURRENCY, ACTION_CONCURRENCY),
+            CONSUMER_PREFETCH
+        )]
+    if QUEUE_LAYOUT != "per_action":
+        raise ValueError(f"Unknown queue layout: {QUEUE_LAYOUT}")
+
+    arguments = {"x-max-priority": QUEUE_MAX_PRIORITY} if QUEUE_MAX_PRIORITY > 0 else None
+    lanes = []
+    for key, action in ROUTING_KEYS.items():
+        concurrency = ACTION_CONCURRENCY[action] or CONSUMER_CONCURRENCY
+        lanes.append(Lane(
+            f"{SHARED_QUEUE}.{key}",
+            [key],
+            Dispatcher(process_message, concurrency),
+            QUEUE_PREFETCH[key] or concurrency,
+            arguments
+        ))
+    return lanes
+
+lanes = build_lanes()
+
+# Metrics read at snapshot time
+in_flight.set_function(lambda: sum(lane.dispatcher.in_flight for lane in lanes))
+user_cache_lookups.set_function(lambda: {
+    ("local_hit",): user_cache.local.hits,
+    ("redis_hit",): user_cache.redis_hits,
+    ("load",): user_cache.loads,
+})
+db_pool.set_function(lambda: {(name,): value for name, value in pool_stats().items()})
+log_suppressed.set_function(suppressed_records)
+
+async def report_queue_depths(connection):
+    channel = None
+    while True:
+        for lane in lanes:
+            try:
+                if channel is None:
+                    channel = await connection.channel()
+                queue_depth.set(await lane.depth(channel), lane.name)
+            except Exception as e:
+                # A failed passive declare closes the channel
+                logger.warning("Error reading depth of queue %s: %s", lane.name, e)
+                channel = None
+        await asyncio.sleep(QUEUE_DEPTH_INTERVAL)
+
+async def unbind_shared_queue(connection):
+    """Stops the legacy shared queue from getting a copy of every per-action message."""
+    channel = await connection.channel()
+    try:
+        queue = await channel.declare_queue(SHARED_QUEUE, passive=True)
+    except ChannelNotFoundEntity:
+        return
+    try:
+        for key in ROUTING_KEYS:
+            await queue.unbind(EXCHANGE_NAME, routing_key=key)
+        backlog = queue.declaration_result.message_count
+        if backlog:
+            logger.warning("%s messages are left in the %s queue; drain them with QUEUE_LAYOUT=shared", backlog, SHARED_QUEUE)
+    finally:
+        await channel.close()
+
+async def main(
+    connect: Optional[Callable[[str], Awaitable[Any]]] = None,
+    ready: Optional[asyncio.Event] = None
+):
+    """Consumes until cancelled, then drains every lane.
+
+    ``connect`` opens the broker connection (aio-pika's ``connect_robust`` by
+    default; the producer passes its in-memory transport when co-located) and
+    ``ready`` is set once the queues are bound.
+    """
+    metrics_task = asyncio.create_task(export_snapshots())
+    if USER_CACHE_REDIS:
+        user_cache.redis = get_async_redis()
+    # Opens DB and Redis connections before taking messages; failures are retried on use
+    await resources.warm_up(["db", "redis"] + (["redis_async"] if USER_CACHE_REDIS else []), strict=False)
+    connection = await (connect or connect_robust)(RABBITMQ_URL)
+    async with connection:
+        for lane in lanes:
+            await lane.declare(connection)
+        if QUEUE_LAYOUT == "per_action":
+            await unbind_shared_queue(connection)
+        if ready is not None:
+            ready.set()
+        workers_ready.set(1)
+
+        depth_task = asyncio.create_task(report_queue_depths(connection))
+        try:
+            await asyncio.gather(*(lane.consume() for lane in lanes))
+        finally:
+            workers_ready.set(0)
+            depth_task.cancel()
+            metrics_task.cancel()
+
+async def serve():
+    """Runs ``main`` until SIGTERM or SIGINT, then drains in-flight messages.
+
+    The first signal stops consuming and waits for dispatched handlers to
+    reply and ack; a second one aborts the drain.
+    """
+    main_task = asyncio.create_task(main())
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, main_task.cancel)
+    try:
+        await main_task
+    except asyncio.CancelledError:
+        logger.info("Consumer stopped after draining in-flight messages")
 
 if __name__ == "__main__":
+    setup_logging()
     try:
-        asyncio.run(main())
-    except KeyboardInterrupt:
-        logger.info("Consumer stopped by user")
+        asyncio.run(serve())
     except Exception as e:
-        logger.error(f"Consumer error: {e}")
-        raise
\ No newline at end of file
+        logger.error("Consumer error: %s", e)
+        raise
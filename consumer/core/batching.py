@@ -0,0 +1,69 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+class MicroBatcher:
+    """Collects submitted items and hands them to ``flush`` in batches.
+
+    A batch is flushed once ``max_size`` items are pending or ``window``
+    seconds after its first item arrived, whichever comes first. ``flush``
+    must return one result per item, in order; each ``submit`` call resolves
+    with its own result. If a batch fails, its items are retried one by one so
+    a single bad item only fails its own ``submit``.
+    """
+    def __init__(
+        self,
+        flush: Callable[[List[Any]], Awaitable[List[Any]]],
+        max_size: int = 50,
+        window: float = 0.005
+    ):
+        self.flush = flush
+        self.max_size = max(1, max_size)
+        self.window = window
+        self._pending: List[Tuple[Any, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        # Strong references to the running flushes, so they are not garbage collected
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def submit(self, item: Any) -> Any:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((item, future))
+        if len(self._pending) >= self.max_size:
+            self._flush_pending()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush_pending)
+        return await future
+
+    def _flush_pending(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.create_task(self._run(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: List[Tuple[Any, asyncio.Future]]):
+        try:
+            results = await self.flush([item for item, _ in batch])
+        except Exception as e:
+            if len(batch) == 1:
+                self._fail(batch, e)
+                return
+            logger.warning("Batch of %s items failed, retrying them one by one: %s", len(batch), e)
+            await asyncio.gather(*(self._run([entry]) for entry in batch))
+            return
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    @staticmethod
+    def _fail(batch: List[Tuple[Any, asyncio.Future]], error: Exception):
+        logger.error("Batch of %s items failed: %s", len(batch), error)
+        for _, future in batch:
+            if not future.done():
+                future.set_exception(error)
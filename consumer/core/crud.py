@@ -1,13 +1,83 @@
+from typing import Any, Dict, List, Optional
+from sqlalchemy import Connection, bindparam, select, update
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.orm import Session
+from consumer.core.db import run_in_connection, run_in_session
 from consumer.core.models import User
 
-async def create_user(db: Session, user: User):
+users_table = User.__table__
+
+# Built once so SQLAlchemy compiles it once and reuses the cached form
+_user_row_by_username = (
+    select(users_table.c.id, users_table.c.username, users_table.c.password, users_table.c.role)
+    .where(users_table.c.username == bindparam("username"))
+    .limit(1)
+)
+
+def _create_user(db: Session, user: User):
     db.add(user)
     db.commit()
     db.refresh(user)
+    return user
 
-async def get_user_by_username(db: Session, username: str):
+def _create_users(db: Session, users: List[Dict[str, Any]]) -> List[Optional[int]]:
+    # Only the first row per username can win; later duplicates in the batch are rejected
+    first_index = {}
+    for index, user in enumerate(users):
+        first_index.setdefault(user["username"], index)
+    rows = [users[index] for index in first_index.values()]
+
+    dialect = postgresql if db.get_bind().dialect.name == "postgresql" else sqlite
+    stmt = (
+        dialect.insert(User)
+        .values(rows)
+        .on_conflict_do_nothing(index_elements=[User.username])
+        .returning(User.username, User.id)
+    )
+    inserted = dict(db.execute(stmt).all())
+    db.commit()
+    return [
+        inserted.get(user["username"]) if first_index[user["username"]] == index else None
+        for index, user in enumerate(users)
+    ]
+
+def _get_user_by_username(db: Session, username: str):
     return db.query(User).filter(User.username == username).first()
 
-async def get_user_by_id(db: Session, user_id: int):
+def _get_user_row_by_username(connection: Connection, username: str) -> Optional[Dict[str, Any]]:
+    row = connection.execute(_user_row_by_username, {"username": username}).mappings().first()
+    return dict(row) if row else None
+
+def _update_password_hash(db: Session, user_id: int, old_hash: str, new_hash: str) -> bool:
+    # Only replaces the hash the rehash was computed from, never a newer password
+    result = db.execute(
+        update(users_table)
+        .where(users_table.c.id == user_id, users_table.c.password == old_hash)
+        .values(password=new_hash)
+    )
+    db.commit()
+    return result.rowcount == 1
+
+def _get_user_by_id(db: Session, user_id: int):
     return db.query(User).filter(User.id == user_id).first()
+
+async def create_user(user: User):
+    return await run_in_session(_create_user, user)
+
+async def create_users(users: List[Dict[str, Any]]) -> List[Optional[int]]:
+    """Inserts users in one statement; returns each new id, or None if it was not created."""
+    return await run_in_session(_create_users, users)
+
+async def get_user_by_username(username: str):
+    return await run_in_session(_get_user_by_username, username)
+
+async def get_user_row_by_username(username: str) -> Optional[Dict[str, Any]]:
+    """Returns the user's columns as a plain dict, without loading an ORM instance."""
+    return await run_in_connection(_get_user_row_by_username, username)
+
+async def update_password_hash(user_id: int, old_hash: str, new_hash: str) -> bool:
+    """Swaps in a rehashed password; False if the stored hash is no longer ``old_hash``."""
+    return await run_in_session(_update_password_hash, user_id, old_hash, new_hash)
+
+async def get_user_by_id(user_id: int):
+    return await run_in_session(_get_user_by_id, user_id)
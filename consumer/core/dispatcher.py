@@ -0,0 +1,64 @@
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import Awaitable, Callable, Dict, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+class Dispatcher:
+    """Runs message handlers as a bounded pool of concurrent tasks.
+
+    ``submit`` waits for a free slot before spawning the handler task, so the
+    number of in-flight messages never exceeds ``concurrency``. Each handler
+    acknowledges its own delivery tag, so acks may be sent out of order
+    without affecting other messages on the channel.
+    """
+    def __init__(
+        self,
+        handler: Callable[..., Awaitable[None]],
+        concurrency: int = 1,
+        action_limits: Optional[Dict[str, int]] = None
+    ):
+        self.handler = handler
+        self.concurrency = max(1, concurrency)
+        self._slots = asyncio.Semaphore(self.concurrency)
+        self._action_slots = {
+            action: asyncio.Semaphore(limit)
+            for action, limit in (action_limits or {}).items()
+            if limit > 0
+        }
+        self._tasks: Set[asyncio.Task] = set()
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._tasks)
+
+    async def submit(self, *args) -> None:
+        await self._slots.acquire()
+        task = asyncio.create_task(self._run(*args))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, *args) -> None:
+        try:
+            await self.handler(*args)
+        except Exception as e:
+            logger.error("Unhandled error in message handler: %s", e)
+        finally:
+            self._slots.release()
+
+    @asynccontextmanager
+    async def action_slot(self, action: str):
+        """Limits how many handlers of the given action run at once."""
+        semaphore = self._action_slots.get(action)
+        if semaphore is None:
+            yield
+            return
+        async with semaphore:
+            yield
+
+    async def drain(self) -> None:
+        """Waits for every in-flight handler to finish."""
+        if self._tasks:
+            logger.info("Waiting for %s in-flight messages...", len(self._tasks))
+            await asyncio.gather(*self._tasks, return_exceptions=True)
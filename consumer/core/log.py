@@ -0,0 +1,14 @@
+import os
+
+from common import log
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_QUEUE = os.getenv("LOG_QUEUE", "true").lower() == "true"
+# Records a second let through per INFO/DEBUG event; 0 disables the limit
+LOG_RATE_LIMIT_PER_SECOND = float(os.getenv("LOG_RATE_LIMIT_PER_SECOND", "10"))
+
+suppressed_records = log.suppressed_records
+
+def setup_logging():
+    """Configures logging for a consumer process from its environment; see common.log."""
+    return log.setup_logging(LOG_LEVEL, LOG_RATE_LIMIT_PER_SECOND, LOG_QUEUE)
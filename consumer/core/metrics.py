@@ -0,0 +1,83 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import Dict, List
+
+from common.metrics import Registry
+
+logger = logging.getLogger(__name__)
+
+registry = Registry()
+
+# Consumer processes write snapshots here; the health app merges and serves them
+METRICS_DIR = os.getenv("CONSUMER_METRICS_DIR", "/tmp/consumer-metrics")
+METRICS_FLUSH_INTERVAL = float(os.getenv("CONSUMER_METRICS_FLUSH_INTERVAL", "1"))
+# Snapshots not refreshed for this long belong to dead processes
+METRICS_STALE_SECONDS = float(os.getenv("CONSUMER_METRICS_STALE_SECONDS", "30"))
+
+message_duration = registry.histogram(
+    "consumer_message_duration_seconds", "Message handling time by action", ("action",)
+)
+queue_wait = registry.histogram(
+    "consumer_queue_wait_seconds", "Time from publish to the start of processing", ("action",)
+)
+expired_messages = registry.counter(
+    "consumer_expired_messages_total", "Messages skipped because their deadline had passed"
+)
+db_duration = registry.histogram(
+    "consumer_db_query_duration_seconds", "DB call time including thread pool wait", ("query",)
+)
+redis_duration = registry.histogram(
+    "consumer_redis_command_duration_seconds", "Redis command latency", ("command",)
+)
+in_flight = registry.gauge("consumer_in_flight_messages", "Messages being handled")
+user_cache_lookups = registry.counter(
+    "consumer_user_cache_lookups_total", "User cache lookups by result", ("result",)
+)
+queue_depth = registry.gauge(
+    "consumer_queue_depth", "Messages ready in each consumed queue", ("queue",), aggregate="max"
+)
+workers_ready = registry.gauge("consumer_workers_ready", "Workers that have warmed up and bound their queues")
+db_pool = registry.gauge("consumer_db_pool", "DB connection pool statistics", ("stat",))
+log_suppressed = registry.counter(
+    "consumer_log_records_suppressed_total", "INFO and DEBUG records dropped by the per-event log rate limit"
+)
+
+def write_snapshot(path: str = None):
+    """Atomically writes this process's metrics snapshot."""
+    os.makedirs(METRICS_DIR, exist_ok=True)
+    path = path or os.path.join(METRICS_DIR, f"consumer-{os.getpid()}.json")
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(registry.snapshot(), f)
+    os.replace(tmp_path, path)
+
+async def export_snapshots():
+    """Writes a snapshot every METRICS_FLUSH_INTERVAL seconds until cancelled."""
+    while True:
+        try:
+            write_snapshot()
+        except Exception as e:
+            logger.error("Error writing metrics snapshot: %s", e)
+        await asyncio.sleep(METRICS_FLUSH_INTERVAL)
+
+def read_snapshots() -> List[Dict[str, dict]]:
+    snapshots = []
+    if not os.path.isdir(METRICS_DIR):
+        return snapshots
+    now = time.time()
+    for name in os.listdir(METRICS_DIR):
+        if not name.endswith(".json"):
+            continue
+        path = os.path.join(METRICS_DIR, name)
+        try:
+            if now - os.path.getmtime(path) > METRICS_STALE_SECONDS:
+                os.remove(path)
+                continue
+            with open(path) as f:
+                snapshots.append(json.load(f))
+        except (OSError, ValueError) as e:
+            logger.warning("Skipping metrics snapshot %s: %s", name, e)
+    return snapshots
@@ -0,0 +1,4 @@
+from common.resources import ResourceRegistry
+
+# This service's clients; see common.resources
+resources = ResourceRegistry()
@@ -1,12 +1,73 @@
-from fastapi import FastAPI
-from consumer.core.db import init_db
+import asyncio
+import ipaddress
+import json
+import os
+
+from fastapi import Depends, FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, PlainTextResponse
+from consumer.core.db import DB_INIT_ON_STARTUP, init_db
+from consumer.core.log import setup_logging
+from common.metrics import merge_snapshots, render_snapshots
+from consumer.core.metrics import read_snapshots
+from consumer.core.resources import resources
+from consumer.utils import redis  # registers the Redis resources
+
+setup_logging()
 
 app = FastAPI()
 
+# What this app checks itself; the workers warm their own connections
+READINESS_RESOURCES = ("db", "redis")
+# Clients allowed to read /metrics and /health/ready (a JSON list of CIDRs, as for
+# the producer); add the networks of the metrics scraper and the orchestrator's probes
+INTERNAL_NETWORKS = [
+    ipaddress.ip_network(network, strict=False)
+    for network in json.loads(os.getenv("INTERNAL_NETWORKS", '["127.0.0.0/8", "::1/128"]'))
+]
+
+def internal_only(request: Request):
+    try:
+        address = ipaddress.ip_address(request.client.host) if request.client else None
+    except ValueError:
+        address = None
+    if address is None or not any(address in network for network in INTERNAL_NETWORKS):
+        raise HTTPException(status_code=403, detail="Forbidden")
+
 @app.on_event("startup")
 async def startup_event():
-    init_db()
+    if DB_INIT_ON_STARTUP:
+        await asyncio.to_thread(init_db)
+    await resources.warm_up(READINESS_RESOURCES, strict=False)
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await resources.close()
 
 @app.get("/")
 async def root():
     return {"message": "Application is running"}
+
+def ready_workers() -> int:
+    metric = merge_snapshots(read_snapshots()).get("consumer_workers_ready")
+    return int(sum(value for _, value in metric["series"])) if metric else 0
+
+@app.get("/health/ready", dependencies=[Depends(internal_only)])
+async def ready():
+    # Ready once the DB and Redis answer and at least one worker consumes.
+    # Only booleans: the reasons are logged, not handed to whoever asks
+    reachable = await resources.warm_up(READINESS_RESOURCES, strict=False)
+    workers_ready = ready_workers() > 0
+    is_ready = reachable and workers_ready
+    return JSONResponse(
+        {
+            "ready": is_ready,
+            "workers_ready": workers_ready,
+            "resources": {name: resources[name].warmed for name in READINESS_RESOURCES},
+        },
+        status_code=200 if is_ready else 503
+    )
+
+@app.get("/metrics", dependencies=[Depends(internal_only)])
+async def metrics():
+    # Consumer processes export snapshots to disk; this merges all of them
+    return PlainTextResponse(render_snapshots(read_snapshots()), media_type="text/plain; version=0.0.4")
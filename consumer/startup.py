@@ -1,9 +1,151 @@
+import logging
+import math
 import os
+import signal
 import subprocess
+import sys
+import time
+from typing import List, Optional
+
+from consumer.core.log import setup_logging
+
+def available_cpus() -> int:
+    """CPUs this process may run on: its affinity mask, capped by a cgroup CPU quota.
+
+    ``os.cpu_count()`` reports every CPU of the host, even in a container
+    limited to one or two of them.
+    """
+    cpus = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1
+    quota = period = None
+    try:
+        # cgroup v2: "<quota> <period>" or "max <period>"
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()
+    except (OSError, ValueError):
+        try:
+            # cgroup v1: a quota of -1 means unlimited
+            with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us") as f:
+                quota = f.read().strip()
+            with open("/sys/fs/cgroup/cpu/cpu.cfs_period_us") as f:
+                period = f.read().strip()
+        except OSError:
+            pass
+    if quota not in (None, "max", "-1") and period:
+        cpus = min(cpus, math.ceil(int(quota) / int(period)))
+    return max(1, cpus)
+
+# Worker processes consuming the messages queue; each has its own prefetch and DB pool
+CONSUMER_WORKERS = int(os.getenv("CONSUMER_WORKERS", "0")) or available_cpus()
+# Every worker and the health app may each open DB_POOL_SIZE + DB_MAX_OVERFLOW
+# connections; together they must stay below the server's max_connections
+# (100 by default on Postgres, shared with the alembic service and other clients)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "0"))
+POSTGRES_MAX_CONNECTIONS = int(os.getenv("POSTGRES_MAX_CONNECTIONS", "100"))
+# Seconds workers get to finish in-flight messages after SIGTERM before they are killed
+CONSUMER_DRAIN_TIMEOUT = float(os.getenv("CONSUMER_DRAIN_TIMEOUT", "25"))
+CONSUMER_HEALTH_PORT = os.getenv("CONSUMER_HEALTH_PORT", "8080")
+RESTART_BACKOFF_MAX = 30.0
+STABLE_AFTER_SECONDS = 60.0
+
+logger = logging.getLogger("consumer.supervisor")
+
+class Child:
+    """A supervised process, restarted with exponential backoff when it exits."""
+    def __init__(self, name: str, args: List[str]):
+        self.name = name
+        self.args = args
+        self.process: Optional[subprocess.Popen] = None
+        self.started_at = 0.0
+        self.failures = 0
+        self.restart_at: Optional[float] = None
+
+    def start(self):
+        # Own session, so a terminal Ctrl-C reaches only the supervisor
+        self.process = subprocess.Popen(self.args, start_new_session=True)
+        self.started_at = time.monotonic()
+        self.restart_at = None
+        logger.info("Started %s (pid %s)", self.name, self.process.pid)
+
+    def check(self, now: float):
+        if self.restart_at is not None:
+            if now >= self.restart_at:
+                self.start()
+            return
+        code = self.process.poll()
+        if code is None:
+            return
+        # A crash loop backs off; a child that ran for a while restarts at once
+        self.failures = 0 if now - self.started_at > STABLE_AFTER_SECONDS else self.failures + 1
+        delay = min(RESTART_BACKOFF_MAX, 2 ** self.failures - 1)
+        logger.error("%s (pid %s) exited with code %s, restarting in %.0fs", self.name, self.process.pid, code, delay)
+        self.restart_at = now + delay
+
+    def terminate(self):
+        if self.process is not None and self.process.poll() is None:
+            self.process.send_signal(signal.SIGTERM)
+
+    def kill(self):
+        if self.process is not None and self.process.poll() is None:
+            logger.warning("%s (pid %s) did not drain in time, killing it", self.name, self.process.pid)
+            self.process.kill()
+
+class Supervisor:
+    def __init__(self, children: List[Child], drain_timeout: float):
+        self.children = children
+        self.drain_timeout = drain_timeout
+        self.stopping = False
+
+    def stop(self, signum, frame):
+        logger.info("Received signal %s, draining workers...", signum)
+        self.stopping = True
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        for child in self.children:
+            child.start()
+
+        while not self.stopping:
+            now = time.monotonic()
+            for child in self.children:
+                child.check(now)
+            time.sleep(0.5)
+
+        for child in self.children:
+            child.terminate()
+        deadline = time.monotonic() + self.drain_timeout
+        for child in self.children:
+            if child.process is None:
+                continue
+            try:
+                child.process.wait(timeout=max(0.0, deadline - time.monotonic()))
+            except subprocess.TimeoutExpired:
+                child.kill()
+                child.process.wait()
+        logger.info("All consumer processes stopped")
 
 def start_app():
-    subprocess.Popen(['uvicorn', 'consumer.main:app', '--host', '0.0.0.0', '--port', '8080', '--reload'])
-    os.system('python /app/consumer/consume.py')
+    children = [
+        Child("health app", [
+            sys.executable, "-m", "uvicorn", "consumer.main:app",
+            "--host", "0.0.0.0", "--port", CONSUMER_HEALTH_PORT
+        ])
+    ]
+    children += [
+        Child(f"worker {index}", [sys.executable, "-m", "consumer.consume"])
+        for index in range(CONSUMER_WORKERS)
+    ]
+    connections = (CONSUMER_WORKERS + 1) * (DB_POOL_SIZE + DB_MAX_OVERFLOW)
+    logger.info("Starting %s consumer workers, up to %s DB connections", CONSUMER_WORKERS, connections)
+    if connections > POSTGRES_MAX_CONNECTIONS:
+        logger.warning(
+            "%s workers with DB_POOL_SIZE=%s and DB_MAX_OVERFLOW=%s may open %s connections, more than "
+            "POSTGRES_MAX_CONNECTIONS=%s; lower CONSUMER_WORKERS or the pool size",
+            CONSUMER_WORKERS, DB_POOL_SIZE, DB_MAX_OVERFLOW, connections, POSTGRES_MAX_CONNECTIONS
+        )
+    Supervisor(children, CONSUMER_DRAIN_TIMEOUT).run()
 
 if __name__ == "__main__":
-    start_app()
\ No newline at end of file
+    setup_logging()
+    start_app()
@@ -0,0 +1,96 @@
+import json
+import logging
+import time
+from typing import Awaitable, Callable, Optional
+
+from common.cache import TTLCache
+from consumer.core.metrics import redis_duration
+
+logger = logging.getLogger(__name__)
+
+# Marks a cached "user not found" result
+_NOT_FOUND = object()
+
+class UserCache:
+    """Read-through cache of user rows keyed by username.
+
+    Lookups go to the in-process LRU first, then to the optional shared Redis
+    tier, and only then to ``loader``. Unknown usernames are cached too, for
+    ``negative_ttl`` seconds, so repeated misses never reach the database.
+    """
+    def __init__(
+        self,
+        local: TTLCache,
+        negative_ttl: float,
+        redis_client=None,
+        redis_ttl: float = 300,
+        prefix: str = "user:"
+    ):
+        self.local = local
+        self.negative_ttl = negative_ttl
+        self.redis = redis_client
+        self.redis_ttl = redis_ttl
+        self.prefix = prefix
+        self.redis_hits = 0
+        self.loads = 0
+
+    async def get(self, username: str, loader: Callable[[str], Awaitable[Optional[dict]]]) -> Optional[dict]:
+        cached = self.local.get(username)
+        if cached is not None:
+            return None if cached is _NOT_FOUND else cached
+
+        if self.redis is not None:
+            start = time.perf_counter()
+            try:
+                raw = await self.redis.get(self.prefix + username)
+            except Exception as e:
+                logger.error("Error reading user cache from Redis: %s", e)
+                raw = None
+            redis_duration.observe(time.perf_counter() - start, "get")
+            if raw is not None:
+                self.redis_hits += 1
+                user = json.loads(raw)
+                self._store_local(username, user)
+                return user
+
+        self.loads += 1
+        user = await loader(username)
+        await self.set(username, user)
+        return user
+
+    def _store_local(self, username: str, user: Optional[dict]):
+        if user is None:
+            self.local.set(username, _NOT_FOUND, self.negative_ttl)
+        else:
+            self.local.set(username, user)
+
+    async def set(self, username: str, user: Optional[dict]):
+        """Stores a user row, or a short-lived "not found" marker for ``None``."""
+        self._store_local(username, user)
+        ttl = self.negative_ttl if user is None else self.redis_ttl
+        if self.redis is not None and ttl > 0:
+            start = time.perf_counter()
+            try:
+                await self.redis.setex(self.prefix + username, max(1, int(ttl)), json.dumps(user))
+            except Exception as e:
+                logger.error("Error writing user cache to Redis: %s", e)
+            redis_duration.observe(time.perf_counter() - start, "setex")
+
+    async def invalidate(self, username: str):
+        self.local.pop(username)
+        if self.redis is not None:
+            try:
+                await self.redis.delete(self.prefix + username)
+            except Exception as e:
+                logger.error("Error invalidating user cache in Redis: %s", e)
+
+    def stats(self) -> dict:
+        local = self.local.stats()
+        lookups = local["hits"] + local["misses"]
+        return {
+            "local_hits": local["hits"],
+            "redis_hits": self.redis_hits,
+            "loads": self.loads,
+            "size": local["size"],
+            "hit_ratio": (lookups - self.loads) / lookups if lookups else 0.0,
+        }
@@ -1,13 +1,39 @@
 import redis
+import redis.asyncio
 
 import os
+import time
 from datetime import datetime
 
 from jose import jwt
 
 from consumer.core.exceptions import InternalServerError
+from consumer.core.metrics import redis_duration
+from consumer.core.resources import resources
 
-redis_client = redis.Redis(host='redis', port=6379, db=0)
+REDIS_URL = os.getenv("REDIS_URL", "redis://redis:6379/0")
+
+async def ping_async_redis(client: redis.asyncio.Redis):
+    await client.ping()
+
+redis_resource = resources.add(
+    "redis",
+    lambda: redis.Redis.from_url(REDIS_URL),
+    warm=lambda client: client.ping(),
+    close=lambda client: client.close()
+)
+async_redis_resource = resources.add(
+    "redis_async",
+    lambda: redis.asyncio.Redis.from_url(REDIS_URL),
+    warm=ping_async_redis,
+    close=lambda client: client.aclose()
+)
+
+def get_redis() -> redis.Redis:
+    return redis_resource.get()
+
+def get_async_redis() -> redis.asyncio.Redis:
+    return async_redis_resource.get()
 
 SECRET_KEY = os.getenv("SECRET_KEY")
 ALGORITHM = os.getenv("ALGORITHM", "HS256")
@@ -24,6 +50,8 @@ def blacklist_token(token):
         current_timestamp = datetime.utcnow().timestamp()
         ttl = int(exp_timestamp - current_timestamp)
         if ttl > 0:
-            redis_client.setex(f"blacklist:{jti}", ttl, "true")
+            start = time.perf_counter()
+            get_redis().setex(f"blacklist:{jti}", ttl, "true")
+            redis_duration.observe(time.perf_counter() - start, "setex")
     except Exception as e:
         raise InternalServerError(f"Error blacklisting token: {str(e)}")
@@ -0,0 +1,65 @@
+"""Picks BCRYPT_ROUNDS for a target password verify latency on this machine.
+
+Usage:
+    python -m producer.calibrate_bcrypt --target-ms 250
+    python -m producer.calibrate_bcrypt --target-ms 100 --min-rounds 10 --samples 5
+
+Each extra round doubles the cost, so rounds are timed upwards until the
+median verify exceeds the target. The highest rounds within the target is
+recommended, never below --min-rounds. Run it on the hardware the producer
+is deployed on; hashes with another cost are rehashed after their next login.
+"""
+import argparse
+import statistics
+import time
+
+from passlib.hash import bcrypt
+
+def median_verify_seconds(rounds: int, samples: int) -> float:
+    hasher = bcrypt.using(rounds=rounds)
+    hashed = hasher.hash("calibration-password")
+    timings = []
+    for _ in range(samples):
+        start = time.perf_counter()
+        hasher.verify("calibration-password", hashed)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+def calibrate(target: float, min_rounds: int, max_rounds: int, samples: int):
+    """Returns the recommended rounds and the (rounds, seconds) measured."""
+    measured = []
+    best = None
+    for rounds in range(4, max_rounds + 1):
+        seconds = median_verify_seconds(rounds, samples if rounds >= min_rounds - 2 else 1)
+        measured.append((rounds, seconds))
+        if seconds > target:
+            break
+        best = rounds
+    return max(best or min_rounds, min_rounds), measured
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--target-ms", type=float, default=250.0, help="verify latency budget per login")
+    parser.add_argument("--min-rounds", type=int, default=10, help="security floor")
+    parser.add_argument("--max-rounds", type=int, default=16)
+    parser.add_argument("--samples", type=int, default=3)
+    parser.add_argument("--workers", type=int, default=None, help="PASSWORD_HASH_WORKERS, for the capacity estimate")
+    args = parser.parse_args()
+
+    rounds, measured = calibrate(args.target_ms / 1000, args.min_rounds, args.max_rounds, args.samples)
+    for measured_rounds, seconds in measured:
+        marker = "  <- recommended" if measured_rounds == rounds else ""
+        print(f"rounds={measured_rounds:2d}  verify {seconds * 1000:9.2f} ms{marker}")
+
+    seconds = dict(measured).get(rounds)
+    if seconds is None:
+        seconds = median_verify_seconds(rounds, args.samples)
+    if seconds > args.target_ms / 1000:
+        print(f"\nWarning: the security floor of {args.min_rounds} rounds exceeds the {args.target_ms:.0f} ms target")
+    workers = args.workers
+    if workers:
+        print(f"\n~{workers / seconds:.0f} logins/s with {workers} hash workers")
+    print(f"\nBCRYPT_ROUNDS={rounds}")
+
+if __name__ == "__main__":
+    main()
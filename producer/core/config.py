@@ -1,6 +1,7 @@
 from pydantic_settings import BaseSettings
 from pydantic import Extra
-from typing import Optional
+from functools import lru_cache
+from typing import Dict, List, Optional
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -15,10 +16,91 @@ class Settings(BaseSettings):
     # OAuth2 settings
     OAUTH2_TOKEN_URL: str = "/auth/login"
     OAUTH2_SCHEME_NAME: str = "OAuth2PasswordBearer"
+
+    # Password hashing executor: "inline", "thread" or "process"
+    PASSWORD_HASH_MODE: str = "thread"
+    PASSWORD_HASH_WORKERS: int = 4
+    # bcrypt cost for new hashes; pick it with `python -m producer.calibrate_bcrypt`.
+    # Hashes with another cost are rehashed in the background after a successful login.
+    BCRYPT_ROUNDS: int = 12
+    PASSWORD_REHASH_ON_LOGIN: bool = True
+
+    # Verified token cache. A token revoked through another producer instance may
+    # still pass here for up to TOKEN_CACHE_TTL_SECONDS + BLACKLIST_SYNC_INTERVAL_SECONDS
+    # (cached payload, then a filter that has not synced the revocation yet);
+    # through this instance it is rejected immediately
+    TOKEN_CACHE_SIZE: int = 10000
+    TOKEN_CACHE_TTL_SECONDS: float = 5.0
+
+    # Redis and token blacklist
+    REDIS_URL: str = "redis://redis:6379/0"
+    REDIS_MAX_CONNECTIONS: int = 50
+    BLACKLIST_FAIL_OPEN: bool = False  # Accept tokens when Redis is unreachable
+    BLACKLIST_FILTER_ENABLED: bool = True
+    BLACKLIST_FILTER_CAPACITY: int = 100000
+    BLACKLIST_FILTER_ERROR_RATE: float = 0.001
+    BLACKLIST_SYNC_INTERVAL_SECONDS: float = 5.0
+
+    # Logout: "rpc" goes through the consumer, "direct" writes the revocation to Redis
+    LOGOUT_MODE: str = "rpc"
+    LOGOUT_AUDIT_EVENTS: bool = False  # Send a fire-and-forget event to the consumer in direct mode
+
+    # "amqp" talks to RabbitMQ; "memory" runs the consumer in this process on an in-memory broker
+    TRANSPORT: str = "amqp"
+
+    # RabbitMQ RPC client
+    RABBITMQ_PUBLISH_CHANNELS: int = 4
+    RABBITMQ_CALLBACK_CONSUMERS: int = 2
+    RABBITMQ_DIRECT_REPLY_TO: bool = False  # Use amq.rabbitmq.reply-to instead of a callback queue
+    WIRE_CODEC: str = "json"  # "json", "orjson" or "msgpack"
+    RPC_TIMEOUT_SECONDS: float = 60.0  # Default deadline, also sent as the message expiration
+    # Message priority per routing key (JSON in the environment); interactive requests go
+    # first. Only the per-action queues honour it, where it puts background events behind
+    # requests of the same action; they already keep logins from waiting behind registrations
+    RPC_PRIORITIES: Dict[str, int] = {"user.login": 5, "user.logout": 5, "user.register": 1}
+    # Concurrent identical RPCs share one round trip; only for actions listed as idempotent
+    RPC_COALESCING: bool = False
+    RPC_COALESCE_ACTIONS: List[str] = ["get_user_by_username"]
+    # Admission control: RPCs beyond the in-flight cap of their routing key get a fast 503
+    RPC_MAX_IN_FLIGHT: int = 1000  # Per routing key, 0 disables the cap
+    RPC_MAX_IN_FLIGHT_OVERRIDES: Dict[str, int] = {}
+    # Shed RPCs while the consumer queue for their routing key holds more messages than this (0 disables)
+    RPC_SHED_QUEUE_DEPTH: int = 0
+    RPC_QUEUE_DEPTH_INTERVAL_SECONDS: float = 1.0
+    RPC_RETRY_AFTER_SECONDS: float = 1.0
+    # Circuit breaker per routing key: opens after consecutive timeouts or unroutable
+    # (returned) requests, fails fast while open, then lets probe requests through
+    RPC_BREAKER_ENABLED: bool = True
+    RPC_BREAKER_FAILURE_THRESHOLD: int = 5
+    RPC_BREAKER_RESET_SECONDS: float = 10.0
+    RPC_BREAKER_HALF_OPEN_CALLS: int = 1
+    # Logging: records go through a queue to a writer thread; per-event rate limit for INFO/DEBUG (0 disables)
+    LOG_LEVEL: str = "INFO"
+    LOG_QUEUE: bool = True
+    LOG_RATE_LIMIT_PER_SECOND: float = 10.0
+
+    # Must match the consumer's QUEUE_LAYOUT to find the queues behind each routing key
+    QUEUE_LAYOUT: str = "per_action"
+
+    # Clients allowed to read /metrics and /health/ready (CIDRs, JSON in the environment);
+    # add the networks of the metrics scraper and the orchestrator's probes
+    INTERNAL_NETWORKS: List[str] = ["127.0.0.0/8", "::1/128"]
     
     class Config:
         env_file = ".env"
         case_sensitive = True
         extra = Extra.allow
 
-settings = Settings()
+@lru_cache
+def get_settings() -> Settings:
+    return Settings()
+
+class _LazySettings:
+    """Reads the environment on first use rather than when this module is imported."""
+    def __getattr__(self, name: str):
+        return getattr(get_settings(), name)
+
+    def __setattr__(self, name: str, value):
+        setattr(get_settings(), name, value)
+
+settings = _LazySettings()
@@ -1,10 +1,17 @@
+import ipaddress
+from functools import lru_cache
+from typing import List, Tuple
+
 from fastapi import Request, Depends
 from fastapi.security import OAuth2PasswordBearer
 from .config import settings
 from .exceptions import UnauthorizedError, ForbiddenError
 
-# dev only
-oauth2_scheme = OAuth2PasswordBearer(tokenUrl=settings.OAUTH2_TOKEN_URL, scheme_name="OAuth2PasswordBearer") # For Swagger to work
+# dev only; the token URL is set from OAUTH2_TOKEN_URL at startup, before the docs are built
+oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login", scheme_name="OAuth2PasswordBearer") # For Swagger to work
+
+def configure_oauth2_scheme():
+    oauth2_scheme.model.flows.password.tokenUrl = settings.OAUTH2_TOKEN_URL
 
 async def get_current_user(request: Request) -> dict:
     payload = request.state.token_payload
@@ -20,6 +27,22 @@ async def get_current_user(request: Request) -> dict:
         
     return {"id": user_id, "role": user_role}
 
+@lru_cache
+def _parse_networks(networks: Tuple[str, ...]) -> List[ipaddress._BaseNetwork]:
+    return [ipaddress.ip_network(network, strict=False) for network in networks]
+
+def is_internal(host: str) -> bool:
+    try:
+        address = ipaddress.ip_address(host)
+    except ValueError:
+        return False
+    return any(address in network for network in _parse_networks(tuple(settings.INTERNAL_NETWORKS)))
+
+async def internal_only(request: Request):
+    """Limits an operational endpoint to clients in INTERNAL_NETWORKS."""
+    if request.client is None or not is_internal(request.client.host):
+        raise ForbiddenError()
+
 def role_checker(required_role: str):
     def _role_checker(current_user: dict = Depends(get_current_user)):
         if current_user["role"] != required_role:
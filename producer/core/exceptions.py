@@ -1,9 +1,12 @@
+import math
+from typing import Dict, Optional
+
 from fastapi import HTTPException, status
 
 class AppException(HTTPException):
     """Base class for all app's exceptions"""
-    def __init__(self, status_code: int, detail: str):
-        super().__init__(status_code=status_code, detail=detail)
+    def __init__(self, status_code: int, detail: str, headers: Optional[Dict[str, str]] = None):
+        super().__init__(status_code=status_code, detail=detail, headers=headers)
 
 class UnauthorizedError(AppException):
     """Authorization error"""
@@ -47,8 +50,9 @@ class InternalServerError(AppException):
 
 class ServiceUnavailableError(AppException):
     """Service unavailable"""
-    def __init__(self, detail: str = "Service Unavailable"):
+    def __init__(self, detail: str = "Service Unavailable", retry_after: Optional[float] = None):
         super().__init__(
             status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-            detail=detail
+            detail=detail,
+            headers={"Retry-After": str(max(1, math.ceil(retry_after)))} if retry_after is not None else None
         ) 
\ No newline at end of file
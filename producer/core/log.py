@@ -0,0 +1,8 @@
+from common import log
+from producer.core.config import settings
+
+suppressed_records = log.suppressed_records
+
+def setup_logging():
+    """Configures logging for the producer from its settings; see common.log."""
+    return log.setup_logging(settings.LOG_LEVEL, settings.LOG_RATE_LIMIT_PER_SECOND, settings.LOG_QUEUE)
@@ -0,0 +1,75 @@
+import time
+
+from common.metrics import Registry
+
+registry = Registry()
+
+# Shared producer metrics
+http_request_duration = registry.histogram(
+    "http_request_duration_seconds", "HTTP request latency by route", ("method", "route", "status")
+)
+rpc_duration = registry.histogram(
+    "rpc_duration_seconds", "RabbitMQ RPC round trip by routing key", ("routing_key",)
+)
+rpc_timeouts = registry.counter(
+    "rpc_timeouts_total", "RPCs that got no reply before their deadline", ("routing_key",)
+)
+rpc_in_flight = registry.gauge("rpc_in_flight", "RPCs waiting for a reply")
+rpc_rejected = registry.counter(
+    "rpc_rejected_total", "RPCs refused by admission control", ("routing_key", "reason")
+)
+rpc_circuit_state = registry.gauge(
+    "rpc_circuit_state", "Circuit breaker state by routing key: 0 closed, 1 half-open, 2 open", ("routing_key",)
+)
+rpc_unroutable = registry.counter(
+    "rpc_unroutable_total", "RPCs returned by the broker because no queue was bound", ("routing_key",)
+)
+rpc_queue_depth = registry.gauge(
+    "rpc_queue_depth", "Consumer queue depth last seen by admission control", ("routing_key",)
+)
+rpc_coalesced = registry.counter(
+    "rpc_coalesce_total", "Coalescable RPCs by whether they were sent or shared an in-flight one", ("result",)
+)
+password_hash_duration = registry.histogram(
+    "password_hash_duration_seconds", "bcrypt hash/verify time including executor wait", ("operation",)
+)
+redis_duration = registry.histogram(
+    "redis_command_duration_seconds", "Redis command latency", ("command",)
+)
+token_cache_lookups = registry.counter(
+    "token_cache_lookups_total", "Verified-token cache lookups by result", ("result",)
+)
+log_suppressed = registry.counter(
+    "log_records_suppressed_total", "INFO and DEBUG records dropped by the per-event log rate limit"
+)
+
+def _route_label(scope) -> str:
+    # Route templates keep label cardinality bounded; unknown paths share one label
+    route = scope.get("route")
+    if route is not None:
+        return route.path
+    endpoint = scope.get("endpoint")
+    return endpoint.__name__ if endpoint is not None else "unmatched"
+
+class MetricsMiddleware:
+    """Pure ASGI middleware timing every HTTP request by its route template."""
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        status = "500"
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = str(message["status"])
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            http_request_duration.observe(time.perf_counter() - start, scope["method"], _route_label(scope), status)
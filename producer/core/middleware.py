@@ -0,0 +1,100 @@
+import json
+import re
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from producer.core.exceptions import AppException
+from producer.utils.security import verify_token
+
+# Routes reachable without a token; anything else needs a bearer token
+PUBLIC_PATHS = frozenset({
+    "/docs", "/docs/oauth2-redirect", "/openapi.json", "/redoc",
+    "/auth/login", "/auth/register", "/metrics", "/health/live", "/health/ready"
+})
+# Only consulted for paths that match no route
+PUBLIC_PREFIXES = ("/docs", "/redoc")
+
+class RoutePolicy:
+    """Whether each registered route is public, computed once from the app's routes."""
+    def __init__(self, table: Dict[str, bool], patterns: List[Tuple[re.Pattern, bool]], prefixes: Tuple[str, ...]):
+        self.table = table
+        self.patterns = patterns
+        self.prefixes = prefixes
+
+    @classmethod
+    def from_routes(cls, routes: Iterable, public_paths=PUBLIC_PATHS, public_prefixes=PUBLIC_PREFIXES) -> "RoutePolicy":
+        table: Dict[str, bool] = {path: True for path in public_paths}
+        patterns: List[Tuple[re.Pattern, bool]] = []
+        for route in routes:
+            path = getattr(route, "path", None)
+            if path is None:
+                continue
+            public = path in public_paths
+            if "{" in path:
+                patterns.append((route.path_regex, public))
+            else:
+                table.setdefault(path, public)
+        return cls(table, patterns, tuple(public_prefixes))
+
+    def is_public(self, path: str) -> bool:
+        public = self.table.get(path)
+        if public is not None:
+            return public
+        for pattern, public in self.patterns:
+            if pattern.match(path):
+                return public
+        return path.startswith(self.prefixes)
+
+def bearer_token(scope) -> Optional[str]:
+    for name, value in scope["headers"]:
+        if name == b"authorization":
+            # Scheme is case-insensitive; the token is everything after "Bearer "
+            if value[:7].lower() == b"bearer " and len(value) > 7:
+                return value[7:].decode("latin-1").strip()
+            return None
+    return None
+
+async def send_error(send, status: int, detail: str, bearer_challenge: bool = False):
+    body = json.dumps({"detail": detail}).encode()
+    headers = [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]
+    if bearer_challenge:
+        headers.append((b"www-authenticate", b"Bearer"))
+    await send({"type": "http.response.start", "status": status, "headers": headers})
+    await send({"type": "http.response.body", "body": body})
+
+class AuthMiddleware:
+    """Pure ASGI bearer-token check in front of every protected route.
+
+    The route policy is built from the application's routes at startup (or on
+    the first request), so deciding whether a path is public is a dict lookup.
+    The verified payload is exposed as ``request.state.token_payload``.
+    """
+    def __init__(self, app, public_paths=PUBLIC_PATHS, public_prefixes=PUBLIC_PREFIXES):
+        self.app = app
+        self.public_paths = frozenset(public_paths)
+        self.public_prefixes = tuple(public_prefixes)
+        self.policy: Optional[RoutePolicy] = None
+
+    def build_policy(self, scope):
+        self.policy = RoutePolicy.from_routes(scope["app"].routes, self.public_paths, self.public_prefixes)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            if scope["type"] == "lifespan":
+                self.build_policy(scope)
+            return await self.app(scope, receive, send)
+
+        if self.policy is None:
+            self.build_policy(scope)
+        if self.policy.is_public(scope["path"]):
+            return await self.app(scope, receive, send)
+
+        token = bearer_token(scope)
+        if token is None:
+            return await send_error(send, 401, "Missing or invalid Authorization header", bearer_challenge=True)
+        try:
+            payload = await verify_token(token)
+        except AppException as e:
+            return await send_error(send, e.status_code, e.detail, bearer_challenge=e.status_code == 401)
+
+        scope.setdefault("state", {})["token_payload"] = payload
+        await self.app(scope, receive, send)
@@ -1,19 +1,227 @@
 import aio_pika
-import json
 import uuid
 import asyncio
+import hashlib
+import json
 import logging
 import os
-from typing import Optional, Dict, Any
+import time
+from itertools import cycle
+from typing import Awaitable, Callable, Iterable, Optional, Dict, Any, List, Set, Tuple
 from fastapi import Request
 
+from producer.core.config import settings
+from producer.core.exceptions import ServiceUnavailableError
+from producer.core.metrics import rpc_duration, rpc_rejected, rpc_timeouts, rpc_unroutable
+from producer.core.resources import resources
+from producer.core.transport import Transport, get_transport
+from common.codec import Codec, DecodeError, codec_for, get_codec
+
 EXCHANGE_NAME = os.getenv("EXCHANGE_NAME", "default_exchange")
+DIRECT_REPLY_TO = "amq.rabbitmq.reply-to"
+CONSUMER_QUEUE = "messages"
+DEADLINE_HEADER = "x-deadline"
+SENT_AT_HEADER = "x-sent-at"
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+class PendingReplies:
+    """Futures waiting for RPC replies, keyed by correlation id.
+
+    An entry removes itself as soon as its future is done, whether it was
+    resolved, failed or cancelled (e.g. by a timeout), so nothing leaks.
+    """
+    def __init__(self):
+        self._futures: Dict[str, asyncio.Future] = {}
+
+    def __len__(self) -> int:
+        return len(self._futures)
+
+    def __contains__(self, correlation_id: str) -> bool:
+        return correlation_id in self._futures
+
+    def create(self, correlation_id: str) -> asyncio.Future:
+        future = asyncio.get_running_loop().create_future()
+        self._futures[correlation_id] = future
+        future.add_done_callback(lambda _: self._futures.pop(correlation_id, None))
+        return future
+
+    def resolve(self, correlation_id: str, result: Any) -> bool:
+        future = self._futures.get(correlation_id)
+        if future is None or future.done():
+            return False
+        future.set_result(result)
+        return True
+
+    def fail(self, correlation_id: str, exc: Exception) -> bool:
+        future = self._futures.get(correlation_id)
+        if future is None or future.done():
+            return False
+        future.set_exception(exc)
+        return True
+
+    def fail_all(self, exc: Exception):
+        for future in list(self._futures.values()):
+            if not future.done():
+                future.set_exception(exc)
+
+class SingleFlight:
+    """Lets concurrent callers with the same key share one in-flight call.
+
+    The call runs as its own task, so a caller that gives up (e.g. a client
+    disconnecting) does not cancel it for the others.
+    """
+    def __init__(self):
+        self._calls: Dict[str, asyncio.Task] = {}
+        self.calls = 0
+        self.shared = 0
+
+    def __len__(self) -> int:
+        return len(self._calls)
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._calls.get(key)
+        if task is None:
+            self.calls += 1
+            task = self._calls[key] = asyncio.create_task(fn())
+            task.add_done_callback(lambda done: self._finish(key, done))
+        else:
+            self.shared += 1
+        return await asyncio.shield(task)
+
+    def _finish(self, key: str, task: asyncio.Task):
+        self._calls.pop(key, None)
+        if not task.cancelled():
+            task.exception()  # retrieved here in case every caller gave up
+
+    def stats(self) -> Dict[str, int]:
+        return {"calls": self.calls, "shared": self.shared, "in_flight": len(self._calls)}
+
+class AdmissionControl:
+    """Refuses RPCs up front once their routing key is over its limits.
+
+    Each routing key has a cap on RPCs waiting for a reply and, if enabled,
+    a maximum depth for the consumer queue behind it (refreshed by
+    ``RabbitMQManager``). Refusals raise ``ServiceUnavailableError`` with a
+    Retry-After, so admitted requests keep a bounded latency instead of every
+    request waiting for the timeout when the consumer falls behind.
+    """
+    def __init__(
+        self,
+        max_in_flight: int = 0,
+        overrides: Optional[Dict[str, int]] = None,
+        shed_queue_depth: int = 0,
+        retry_after: float = 1.0
+    ):
+        self.max_in_flight = max_in_flight
+        self.overrides = dict(overrides or {})
+        self.shed_queue_depth = shed_queue_depth
+        self.retry_after = retry_after
+        self.in_flight: Dict[str, int] = {}
+        self.depths: Dict[str, int] = {}
+
+    def limit(self, routing_key: str) -> int:
+        return self.overrides.get(routing_key, self.max_in_flight)
+
+    def acquire(self, routing_key: str):
+        if self.shed_queue_depth and self.depths.get(routing_key, 0) > self.shed_queue_depth:
+            self._reject(routing_key, "queue_depth")
+        in_flight = self.in_flight.get(routing_key, 0)
+        limit = self.limit(routing_key)
+        if limit and in_flight >= limit:
+            self._reject(routing_key, "in_flight")
+        self.in_flight[routing_key] = in_flight + 1
+
+    def release(self, routing_key: str):
+        self.in_flight[routing_key] -= 1
+
+    def _reject(self, routing_key: str, reason: str):
+        rpc_rejected.inc(1, routing_key, reason)
+        raise ServiceUnavailableError("Service is overloaded, retry later", retry_after=self.retry_after)
+
+class UnroutableError(Exception):
+    """The broker returned a mandatory request because no queue is bound for it."""
+
+class CircuitBreaker:
+    """Fails calls fast while their target looks down.
+
+    Closed, calls go through and consecutive failures are counted; at
+    ``failure_threshold`` the breaker opens. Open, calls are refused with
+    ``ServiceUnavailableError`` until ``reset_timeout`` has passed; then it
+    is half-open and lets ``half_open_calls`` probes through. A successful
+    probe closes it again, a failed one reopens it.
+    """
+    CLOSED = "closed"
+    HALF_OPEN = "half_open"
+    OPEN = "open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 10.0, half_open_calls: int = 1):
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self.half_open_calls = max(1, half_open_calls)
+        self.failures = 0
+        self.opened_at = 0.0
+        self._state = self.CLOSED
+        self._probes = 0
+
+    @property
+    def state(self) -> str:
+        if self._state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+            self._state = self.HALF_OPEN
+            self._probes = 0
+        return self._state
+
+    def before_call(self) -> bool:
+        """Raises if the call may not go through; returns whether it is a half-open probe."""
+        state = self.state
+        if state == self.OPEN:
+            retry_after = self.reset_timeout - (time.monotonic() - self.opened_at)
+            raise ServiceUnavailableError("Consumer unavailable, retry later", retry_after=retry_after)
+        if state == self.HALF_OPEN:
+            if self._probes >= self.half_open_calls:
+                raise ServiceUnavailableError("Consumer unavailable, retry later", retry_after=self.reset_timeout)
+            self._probes += 1
+            return True
+        return False
+
+    def after_call(self, probe: bool, failed: Optional[bool]):
+        """Records an outcome; ``failed=None`` means the call proved nothing either way."""
+        if probe:
+            self._probes -= 1
+        if failed is None:
+            return
+        state = self.state
+        if not failed:
+            self.failures = 0
+            self._state = self.CLOSED
+        elif state != self.OPEN:
+            # Failures of calls sent before the breaker opened do not extend it
+            self.failures += 1
+            if state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self._state = self.OPEN
+                self.opened_at = time.monotonic()
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {"state": self.state, "failures": self.failures}
+
 class RabbitMQManager:
-    def __init__(self, url: str = None):
+    def __init__(
+        self,
+        url: str = None,
+        publish_channels: Optional[int] = None,
+        callback_consumers: Optional[int] = None,
+        direct_reply_to: Optional[bool] = None,
+        codec: Optional[str] = None,
+        transport: Optional[str] = None,
+        coalescing: Optional[bool] = None,
+        coalesce_actions: Optional[Iterable[str]] = None,
+        admission: Optional[AdmissionControl] = None,
+        breaker_enabled: Optional[bool] = None
+    ):
+        # Arguments left out come from the settings, read here rather than at import
+        def setting(value, name: str):
+            return getattr(settings, name) if value is None else value
+
         if url is None:
             host = os.getenv("RABBITMQ_HOST", "rabbitmq")
             port = os.getenv("RABBITMQ_PORT", "5672")
@@ -22,108 +230,309 @@ class RabbitMQManager:
             self.url = f"amqp://{user}:{password}@{host}:{port}/"
         else:
             self.url = url
+        self.publish_channels = max(1, setting(publish_channels, "RABBITMQ_PUBLISH_CHANNELS"))
+        self.callback_consumers = max(1, setting(callback_consumers, "RABBITMQ_CALLBACK_CONSUMERS"))
+        self.direct_reply_to = setting(direct_reply_to, "RABBITMQ_DIRECT_REPLY_TO")
+        self.codec: Codec = get_codec(setting(codec, "WIRE_CODEC"))
+        self.transport: Transport = get_transport(setting(transport, "TRANSPORT"))
         self.connection: Optional[aio_pika.RobustConnection] = None
         self.channel: Optional[aio_pika.RobustChannel] = None
         self.exchange: Optional[aio_pika.Exchange] = None
         self.callback_queue: Optional[aio_pika.Queue] = None
-        self.futures: Dict[str, asyncio.Future] = {}
+        self.reply_to: Optional[str] = None
+        self.futures = PendingReplies()
+        self.coalescing = setting(coalescing, "RPC_COALESCING")
+        self.coalesce_actions = frozenset(setting(coalesce_actions, "RPC_COALESCE_ACTIONS"))
+        self.single_flight = SingleFlight()
+        self.admission = admission or AdmissionControl(
+            settings.RPC_MAX_IN_FLIGHT,
+            settings.RPC_MAX_IN_FLIGHT_OVERRIDES,
+            settings.RPC_SHED_QUEUE_DEPTH,
+            settings.RPC_RETRY_AFTER_SECONDS
+        )
+        self._depth_task: Optional[asyncio.Task] = None
+        self.breaker_enabled = setting(breaker_enabled, "RPC_BREAKER_ENABLED")
+        self.breakers: Dict[str, CircuitBreaker] = {}
+        self._publishers: List[Tuple[aio_pika.RobustChannel, aio_pika.Exchange]] = []
+        self._publisher_cycle = None
+        self._background_tasks: Set[asyncio.Task] = set()
 
     async def connect(self):
         try:
-            logger.info("Connecting to RabbitMQ...")
-            self.connection = await aio_pika.connect_robust(self.url)
-            self.channel = await self.connection.channel()
-            
-            # exchange creation
-            logger.info(f"Declaring exchange {EXCHANGE_NAME}...")
-            self.exchange = await self.channel.declare_exchange(
-                EXCHANGE_NAME,
-                aio_pika.ExchangeType.DIRECT,
-                durable=True
-            )
-            
-            # callback queue creation
-            logger.info("Creating callback queue...")
-            self.callback_queue = await self.channel.declare_queue(
-                exclusive=True,
-                auto_delete=True,
-                durable=False
-            )
-            
-            # Bind callback queue with exchange
-            await self.callback_queue.bind(self.exchange, routing_key=self.callback_queue.name)
-            
-            # Callback queue listening
-            await self.callback_queue.consume(self.on_response)
+            logger.info("Connecting to RabbitMQ (%s transport)...", self.transport.name)
+            self.connection = await self.transport.connect(self.url)
+
+            # publishing channels, each with its own handle on the exchange
+            logger.info("Opening %s publishing channels on exchange %s...", self.publish_channels, EXCHANGE_NAME)
+            for _ in range(self.publish_channels):
+                # aiormq only hands returned messages to on_return on a channel with publisher
+                # confirms; without them an unroutable request would wait out its timeout
+                channel = await self.connection.channel(publisher_confirms=True)
+                exchange = await channel.declare_exchange(
+                    EXCHANGE_NAME,
+                    aio_pika.ExchangeType.DIRECT,
+                    durable=True
+                )
+                channel.return_callbacks.add(self.on_return)
+                self._publishers.append((channel, exchange))
+            self._publisher_cycle = cycle(self._publishers)
+            self.channel, self.exchange = self._publishers[0]
+
+            if self.direct_reply_to:
+                await self._consume_direct_replies()
+            else:
+                await self._declare_callback_queue()
+            if self.admission.shed_queue_depth:
+                self._depth_task = asyncio.create_task(self._watch_queue_depths())
             logger.info("RabbitMQ connection established successfully")
             return self
         except Exception as e:
-            logger.error(f"Error connecting to RabbitMQ: {e}")
+            logger.error("Error connecting to RabbitMQ: %s", e)
             raise
 
+    async def _consume_direct_replies(self):
+        # Replies sent to amq.rabbitmq.reply-to come back on the channel that
+        # published the request, so every publishing channel consumes it.
+        # A passive declare keeps the consumer restored after a reconnect.
+        logger.info("Using direct reply-to for RPC replies...")
+        for channel, _ in self._publishers:
+            queue = await channel.declare_queue(DIRECT_REPLY_TO, passive=True)
+            await queue.consume(self.on_response, no_ack=True)
+        self.reply_to = DIRECT_REPLY_TO
+
+    async def _declare_callback_queue(self):
+        # callback queue creation
+        logger.info("Creating callback queue...")
+        self.callback_queue = await self.channel.declare_queue(
+            exclusive=True,
+            auto_delete=True,
+            durable=False
+        )
+
+        # Bind callback queue with exchange
+        await self.callback_queue.bind(self.exchange, routing_key=self.callback_queue.name)
+
+        # Callback queue listening, one consumer per channel
+        for _ in range(self.callback_consumers):
+            channel = await self.connection.channel()
+            queue = await channel.get_queue(self.callback_queue.name, ensure=False)
+            await queue.consume(self.on_response)
+        self.reply_to = self.callback_queue.name
+
+    @staticmethod
+    def _queue_name(routing_key: str) -> str:
+        # Mirrors the consumer's queue layout
+        return CONSUMER_QUEUE if settings.QUEUE_LAYOUT == "shared" else f"{CONSUMER_QUEUE}.{routing_key}"
+
+    async def _watch_queue_depths(self):
+        """Refreshes the queue depths behind every routing key RPCs were sent to."""
+        channel = None
+        while True:
+            queues: Dict[str, List[str]] = {}
+            for routing_key in list(self.admission.in_flight):
+                queues.setdefault(self._queue_name(routing_key), []).append(routing_key)
+            for name, routing_keys in queues.items():
+                try:
+                    if channel is None:
+                        channel = await self.connection.channel()
+                    queue = await channel.declare_queue(name, passive=True)
+                    depth = queue.declaration_result.message_count
+                except Exception as e:
+                    # A failed passive declare closes the channel
+                    logger.warning("Error reading depth of queue %s: %s", name, e)
+                    channel = None
+                    continue
+                for routing_key in routing_keys:
+                    self.admission.depths[routing_key] = depth
+            await asyncio.sleep(settings.RPC_QUEUE_DEPTH_INTERVAL_SECONDS)
+
     async def close(self):
+        if self._depth_task is not None:
+            self._depth_task.cancel()
+            self._depth_task = None
         if self.connection:
+            self.futures.fail_all(RuntimeError("RabbitMQ connection closed"))
             await self.connection.close()
             logger.info("RabbitMQ connection closed")
 
     async def on_response(self, message: aio_pika.Message):
         try:
-            async with message.process():
+            # Direct reply-to deliveries are no-ack and arrive already processed
+            async with message.process(ignore_processed=True):
                 if message.correlation_id in self.futures:
-                    logger.info(f"Received response for correlation_id: {message.correlation_id}")
-                    future = self.futures.pop(message.correlation_id)
-                    future.set_result(json.loads(message.body.decode()))
+                    logger.debug("Received response for correlation_id: %s", message.correlation_id)
+                    codec = codec_for(message.content_type, message.content_encoding)
+                    self.futures.resolve(message.correlation_id, codec.decode(message.body))
                 else:
-                    logger.warning(f"Received response for unknown correlation_id: {message.correlation_id}")
-        except json.JSONDecodeError as e:
-            logger.error(f"Invalid JSON in response: {e}")
+                    logger.warning("Received response for unknown correlation_id: %s", message.correlation_id)
+        except DecodeError as e:
+            logger.error("Invalid response body: %s", e)
             if not message.processed:
                 await message.reject(requeue=False)
         except Exception as e:
-            logger.error(f"Error processing response: {e}")
+            logger.error("Error processing response: %s", e)
             if not message.processed:
                 await message.reject(requeue=False)
 
+    def on_return(self, channel, message: aio_pika.abc.AbstractIncomingMessage):
+        # Requests are published as mandatory, so one nobody consumes comes back here
+        rpc_unroutable.inc(1, message.routing_key or "")
+        if message.correlation_id is None or not self.futures.fail(
+            message.correlation_id, UnroutableError(f"No queue is bound for {message.routing_key}")
+        ):
+            logger.warning("Message to %s was returned as unroutable", message.routing_key)
+
+    def breaker(self, routing_key: str) -> CircuitBreaker:
+        breaker = self.breakers.get(routing_key)
+        if breaker is None:
+            breaker = self.breakers[routing_key] = CircuitBreaker(
+                settings.RPC_BREAKER_FAILURE_THRESHOLD,
+                settings.RPC_BREAKER_RESET_SECONDS,
+                settings.RPC_BREAKER_HALF_OPEN_CALLS
+            )
+        return breaker
+
+    def breaker_states(self) -> Dict[str, Dict[str, Any]]:
+        return {routing_key: breaker.snapshot() for routing_key, breaker in self.breakers.items()}
+
+    @staticmethod
+    def _priority(routing_key: str, priority: Optional[int]) -> int:
+        # Only honoured by queues declared with x-max-priority
+        return settings.RPC_PRIORITIES.get(routing_key, 0) if priority is None else priority
+
+    def _next_exchange(self) -> aio_pika.Exchange:
+        _, exchange = next(self._publisher_cycle)
+        return exchange
+
     async def publish_message(
         self,
         routing_key: str,
         message: dict,
-        exchange_name: str = EXCHANGE_NAME
+        exchange_name: str = EXCHANGE_NAME,
+        timeout: Optional[float] = None,
+        priority: Optional[int] = None
     ) -> dict:
         if not self.connection or not self.channel or not self.exchange:
             raise RuntimeError("RabbitMQ connection not established")
 
+        if self.coalescing and message.get("action") in self.coalesce_actions:
+            # Callers joining an identical request share its reply and its deadline
+            return await self.single_flight.do(
+                self._coalesce_key(routing_key, message),
+                lambda: self._call(routing_key, message, timeout, priority)
+            )
+        return await self._call(routing_key, message, timeout, priority)
+
+    @staticmethod
+    def _coalesce_key(routing_key: str, message: dict) -> str:
+        payload = json.dumps(message, sort_keys=True, separators=(",", ":"))
+        return hashlib.sha256(f"{routing_key}\0{payload}".encode()).hexdigest()
+
+    async def _call(
+        self,
+        routing_key: str,
+        message: dict,
+        timeout: Optional[float],
+        priority: Optional[int]
+    ) -> dict:
+        if timeout is None:
+            timeout = settings.RPC_TIMEOUT_SECONDS
+        # The broker drops the request once nobody waits for it, and the
+        # consumer skips it if it is dequeued after the deadline
+        sent_at = time.time()
+        deadline = sent_at + timeout
+        start = time.perf_counter()
+
+        body = self.codec.encode(message)
+
+        breaker = self.breaker(routing_key) if self.breaker_enabled else None
+        probe = breaker.before_call() if breaker else False
+        failed = None
+        try:
+            # Raises before anything is published if the routing key is saturated
+            self.admission.acquire(routing_key)
+        except ServiceUnavailableError:
+            if breaker:
+                breaker.after_call(probe, None)
+            raise
         correlation_id = str(uuid.uuid4())
-        future = asyncio.Future()
-        self.futures[correlation_id] = future
-
-        body = json.dumps(message).encode()
-        
-        logger.info(f"Publishing message to {routing_key} with correlation_id: {correlation_id}")
-        await self.exchange.publish(
-            aio_pika.Message(
-                body=body,
-                correlation_id=correlation_id,
-                reply_to=self.callback_queue.name
-            ),
-            routing_key=routing_key
-        )
+        # Registered before publishing so a fast reply can never be missed
+        future = self.futures.create(correlation_id)
 
         try:
-            # Increase timeout to 60 seconds
-            response = await asyncio.wait_for(future, timeout=60.0)
-            logger.info(f"Received response for correlation_id: {correlation_id}")
+            logger.debug("Publishing message to %s with correlation_id: %s", routing_key, correlation_id)
+            await self._next_exchange().publish(
+                aio_pika.Message(
+                    body=body,
+                    content_type=self.codec.content_type,
+                    content_encoding=self.codec.content_encoding,
+                    correlation_id=correlation_id,
+                    reply_to=self.reply_to,
+                    expiration=timeout,
+                    priority=self._priority(routing_key, priority),
+                    headers={DEADLINE_HEADER: deadline, SENT_AT_HEADER: sent_at}
+                ),
+                routing_key=routing_key,
+                mandatory=True
+            )
+
+            response = await asyncio.wait_for(future, timeout=max(0.0, deadline - time.time()))
+            failed = False
+            rpc_duration.observe(time.perf_counter() - start, routing_key)
+            logger.debug("Received response for correlation_id: %s", correlation_id)
             return response
+        except UnroutableError as e:
+            failed = True
+            logger.error("Request for correlation_id %s was returned: %s", correlation_id, e)
+            raise ServiceUnavailableError("No consumer is listening, retry later", retry_after=settings.RPC_RETRY_AFTER_SECONDS)
         except asyncio.TimeoutError:
-            if correlation_id in self.futures:
-                self.futures.pop(correlation_id)
-            logger.error(f"Timeout waiting for response for correlation_id: {correlation_id}")
+            failed = True
+            rpc_timeouts.inc(1, routing_key)
+            logger.error("Timeout waiting for response for correlation_id: %s", correlation_id)
             raise RuntimeError("Timeout waiting for response from consumer")
         except Exception as e:
-            if correlation_id in self.futures:
-                self.futures.pop(correlation_id)
-            logger.error(f"Error processing response for correlation_id {correlation_id}: {e}")
+            logger.error("Error processing response for correlation_id %s: %s", correlation_id, e)
             raise RuntimeError(f"Error processing response: {str(e)}")
+        finally:
+            future.cancel()
+            self.admission.release(routing_key)
+            if breaker:
+                breaker.after_call(probe, failed)
+
+    def publish_event(self, routing_key: str, message: dict, priority: Optional[int] = None):
+        """Publishes a message that expects no reply, without waiting for it to be sent."""
+        if not self.connection or not self.channel or not self.exchange:
+            raise RuntimeError("RabbitMQ connection not established")
+
+        task = asyncio.create_task(self._publish_event(routing_key, message, priority))
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+
+    async def _publish_event(self, routing_key: str, message: dict, priority: Optional[int]):
+        try:
+            await self._next_exchange().publish(
+                aio_pika.Message(
+                    body=self.codec.encode(message),
+                    content_type=self.codec.content_type,
+                    content_encoding=self.codec.content_encoding,
+                    priority=self._priority(routing_key, priority)
+                ),
+                routing_key=routing_key
+            )
+        except Exception as e:
+            logger.error("Error publishing event to %s: %s", routing_key, e)
+
+async def connect_rabbitmq(manager: RabbitMQManager):
+    await manager.connect()
+
+# Connected during startup; the producer cannot serve anything without it
+rabbitmq_resource = resources.add(
+    "rabbitmq",
+    RabbitMQManager,
+    warm=connect_rabbitmq,
+    close=lambda manager: manager.close(),
+    required=True
+)
 
-# Global instance
-rabbitmq_manager = RabbitMQManager()
\ No newline at end of file
+def get_rabbitmq_manager() -> RabbitMQManager:
+    return rabbitmq_resource.get()
@@ -0,0 +1,345 @@
+"""Transports the RPC client and the consumer run on.
+
+A transport's ``connect`` returns an aio-pika style robust connection, so
+``RabbitMQManager`` and ``consumer.consume.main`` work unchanged on either:
+
+* ``amqp`` connects to RabbitMQ with aio-pika.
+* ``memory`` is a broker inside this process built on asyncio queues. It
+  keeps the AMQP semantics the services rely on (direct exchanges, the
+  default exchange routing by queue name, competing consumers, per-consumer
+  prefetch, priority queues, message expiration and mandatory returns), so
+  producer and consumer can be co-located without a network hop.
+"""
+import asyncio
+import itertools
+from abc import ABC, abstractmethod
+import time
+import uuid
+from contextlib import asynccontextmanager
+from typing import Callable, Dict, List, Optional, Set
+
+import aio_pika
+from aio_pika.tools import CallbackCollection
+
+DIRECT_REPLY_TO = "amq.rabbitmq.reply-to"
+
+_MESSAGE_PROPERTIES = (
+    "body", "headers", "content_type", "content_encoding", "delivery_mode", "priority",
+    "correlation_id", "reply_to", "message_id", "timestamp", "type", "user_id", "app_id"
+)
+
+class Transport(ABC):
+    name = ""
+
+    @abstractmethod
+    async def connect(self, url: str):
+        ...
+
+class AMQPTransport(Transport):
+    name = "amqp"
+
+    async def connect(self, url: str):
+        return await aio_pika.connect_robust(url)
+
+class MemoryMessage:
+    """Delivered message with the attributes and settlement methods of aio-pika's."""
+    def __init__(self, message, exchange: str, routing_key: str, queue: "MemoryQueueState" = None):
+        for name in _MESSAGE_PROPERTIES:
+            setattr(self, name, getattr(message, name, None))
+        self.headers = dict(self.headers or {})
+        self.exchange = exchange
+        self.routing_key = routing_key
+        self.redelivered = False
+        self.processed = False
+        self.delivery_tag = None
+        self._queue = queue
+        self._release: Optional[Callable[[], None]] = None
+        expiration = getattr(message, "expiration", None)
+        self.expiration = expiration
+        self.expires_at = time.monotonic() + expiration if isinstance(expiration, (int, float)) else None
+
+    def _settle(self):
+        if self.processed:
+            raise aio_pika.exceptions.MessageProcessError("Message already processed", self)
+        self.processed = True
+        if self._release is not None:
+            self._release()
+            self._release = None
+
+    async def ack(self, multiple: bool = False):
+        self._settle()
+
+    async def reject(self, requeue: bool = False):
+        self._settle()
+        if requeue and self._queue is not None:
+            self.processed = False
+            self.redelivered = True
+            self._queue.put(self)
+
+    async def nack(self, multiple: bool = False, requeue: bool = True):
+        await self.reject(requeue=requeue)
+
+    @asynccontextmanager
+    async def process(self, requeue: bool = False, reject_on_redelivered: bool = False, ignore_processed: bool = False):
+        try:
+            yield self
+        except BaseException:
+            if not self.processed:
+                await self.reject(requeue=requeue)
+            raise
+        if not self.processed:
+            await self.ack()
+
+class MemoryQueueState:
+    def __init__(self, name: str, arguments: Optional[dict] = None):
+        self.name = name
+        self.arguments = dict(arguments or {})
+        self.max_priority = int(self.arguments.get("x-max-priority") or 0)
+        # Entries are (-priority, arrival, message) so higher priorities leave first, FIFO within one
+        self.messages: asyncio.Queue = asyncio.PriorityQueue()
+        self.consumers = 0
+        self._arrivals = itertools.count()
+
+    def put(self, message: MemoryMessage):
+        priority = min(message.priority or 0, self.max_priority)
+        self.messages.put_nowait((-priority, next(self._arrivals), message))
+
+    async def get(self) -> MemoryMessage:
+        while True:
+            _, _, message = await self.messages.get()
+            # Like RabbitMQ, expired messages are dropped when they reach the head
+            if message.expires_at is None or message.expires_at > time.monotonic():
+                return message
+
+class MemoryBroker:
+    def __init__(self):
+        self.queues: Dict[str, MemoryQueueState] = {}
+        self.bindings: Dict[str, Dict[str, Set[str]]] = {}
+        self.published = 0
+
+    async def connect(self, *args, **kwargs) -> "MemoryConnection":
+        return MemoryConnection(self)
+
+    def queue(self, name: str, arguments: Optional[dict] = None) -> MemoryQueueState:
+        state = self.queues.get(name)
+        if state is None:
+            state = self.queues[name] = MemoryQueueState(name, arguments)
+        return state
+
+    def route(self, exchange: str, routing_key: str) -> List[MemoryQueueState]:
+        if exchange == "":
+            queue = self.queues.get(routing_key)
+            return [queue] if queue else []
+        names = self.bindings.get(exchange, {}).get(routing_key, ())
+        return [self.queues[name] for name in names if name in self.queues]
+
+    def has_consumers(self, exchange: str, routing_key: str) -> bool:
+        return any(queue.consumers for queue in self.route(exchange, routing_key))
+
+    async def deliver(self, exchange: str, message, routing_key: str) -> bool:
+        self.published += 1
+        queues = self.route(exchange, routing_key)
+        for queue in queues:
+            queue.put(MemoryMessage(message, exchange, routing_key, queue))
+        return bool(queues)
+
+class MemoryConnection:
+    def __init__(self, broker: MemoryBroker):
+        self.broker = broker
+        self.is_closed = False
+        self._channels: List["MemoryChannel"] = []
+
+    async def channel(self, publisher_confirms: bool = True, on_return_raises: bool = False, **kwargs) -> "MemoryChannel":
+        channel = MemoryChannel(self.broker, publisher_confirms, on_return_raises)
+        self._channels.append(channel)
+        return channel
+
+    async def close(self):
+        for channel in self._channels:
+            await channel.close()
+        self.is_closed = True
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+class MemoryExchange:
+    def __init__(self, channel: "MemoryChannel", name: str):
+        self.channel = channel
+        self.name = name
+
+    async def publish(self, message, routing_key: str, *, mandatory: bool = True, **kwargs):
+        routed = await self.channel.broker.deliver(self.name, message, routing_key)
+        # Like aiormq, returns only reach a channel that tracks publisher confirms
+        if not routed and mandatory and self.channel.publisher_confirms:
+            returned = MemoryMessage(message, self.name, routing_key)
+            returned.processed = True
+            if self.channel.on_return_raises:
+                raise aio_pika.exceptions.PublishError(returned, None)
+            self.channel.return_callbacks(returned)
+
+class _DeclarationResult:
+    def __init__(self, message_count: int, consumer_count: int):
+        self.message_count = message_count
+        self.consumer_count = consumer_count
+
+class MemoryQueue:
+    def __init__(self, channel: "MemoryChannel", state: MemoryQueueState):
+        self.channel = channel
+        self.state = state
+        self.name = state.name
+        self.arguments = state.arguments
+
+    @property
+    def declaration_result(self) -> _DeclarationResult:
+        return _DeclarationResult(self.state.messages.qsize(), self.state.consumers)
+
+    async def bind(self, exchange, routing_key: str = None, **kwargs):
+        exchange = getattr(exchange, "name", exchange)
+        self.channel.broker.bindings.setdefault(exchange, {}).setdefault(routing_key or self.name, set()).add(self.name)
+
+    async def unbind(self, exchange, routing_key: str = None, **kwargs):
+        exchange = getattr(exchange, "name", exchange)
+        self.channel.broker.bindings.get(exchange, {}).get(routing_key or self.name, set()).discard(self.name)
+
+    async def _next(self, window: Optional[asyncio.Semaphore], no_ack: bool) -> MemoryMessage:
+        if window is not None:
+            await window.acquire()
+        try:
+            message = await self.state.get()
+        except BaseException:
+            if window is not None:
+                window.release()
+            raise
+        if no_ack:
+            message.processed = True
+            if window is not None:
+                window.release()
+        elif window is not None:
+            message._release = window.release
+        return message
+
+    async def consume(self, callback: Callable, no_ack: bool = False, **kwargs) -> str:
+        window = self.channel.window()
+        tasks: Set[asyncio.Task] = set()
+
+        async def run():
+            self.state.consumers += 1
+            try:
+                while True:
+                    message = await self._next(window, no_ack)
+                    # aio-pika runs callbacks concurrently, up to the prefetch
+                    task = asyncio.create_task(callback(message))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+            finally:
+                self.state.consumers -= 1
+
+        consumer_tag = f"ctag.{uuid.uuid4().hex}"
+        self.channel.consumers[consumer_tag] = asyncio.create_task(run())
+        return consumer_tag
+
+    async def cancel(self, consumer_tag: str, **kwargs):
+        task = self.channel.consumers.pop(consumer_tag, None)
+        if task is not None:
+            task.cancel()
+
+    @asynccontextmanager
+    async def iterator(self, no_ack: bool = False, **kwargs):
+        iterator = _QueueIterator(self, self.channel.window(), no_ack)
+        self.state.consumers += 1
+        try:
+            yield iterator
+        finally:
+            self.state.consumers -= 1
+
+class _QueueIterator:
+    def __init__(self, queue: MemoryQueue, window: Optional[asyncio.Semaphore], no_ack: bool):
+        self.queue = queue
+        self.window = window
+        self.no_ack = no_ack
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> MemoryMessage:
+        return await self.queue._next(self.window, self.no_ack)
+
+class MemoryChannel:
+    _anonymous = itertools.count()
+
+    def __init__(self, broker: MemoryBroker, publisher_confirms: bool = True, on_return_raises: bool = False):
+        self.broker = broker
+        self.publisher_confirms = publisher_confirms
+        self.on_return_raises = on_return_raises
+        self.prefetch_count = 0
+        self.default_exchange = MemoryExchange(self, "")
+        self.return_callbacks = CallbackCollection(self)
+        self.consumers: Dict[str, asyncio.Task] = {}
+        self.is_closed = False
+
+    def window(self) -> Optional[asyncio.Semaphore]:
+        return asyncio.Semaphore(self.prefetch_count) if self.prefetch_count else None
+
+    async def set_qos(self, prefetch_count: int = 0, **kwargs):
+        self.prefetch_count = prefetch_count
+
+    async def declare_exchange(self, name: str, *args, **kwargs) -> MemoryExchange:
+        self.broker.bindings.setdefault(name, {})
+        return MemoryExchange(self, name)
+
+    async def get_exchange(self, name: str, *, ensure: bool = True) -> MemoryExchange:
+        return MemoryExchange(self, name)
+
+    async def declare_queue(
+        self,
+        name: Optional[str] = None,
+        *,
+        passive: bool = False,
+        arguments: Optional[dict] = None,
+        **kwargs
+    ) -> MemoryQueue:
+        if not name:
+            name = f"amq.gen-{next(self._anonymous)}"
+        if passive and name not in self.broker.queues and not name.startswith(DIRECT_REPLY_TO):
+            self.is_closed = True  # like RabbitMQ, the failed declare closes the channel
+            raise aio_pika.exceptions.ChannelNotFoundEntity(f"NOT_FOUND - no queue '{name}'")
+        existing = self.broker.queues.get(name)
+        if not passive and existing is not None and existing.arguments != dict(arguments or {}):
+            self.is_closed = True  # RabbitMQ never changes the arguments of an existing queue
+            raise aio_pika.exceptions.ChannelPreconditionFailed(
+                f"PRECONDITION_FAILED - inequivalent arguments for queue '{name}'"
+            )
+        return MemoryQueue(self, self.broker.queue(name, arguments))
+
+    async def get_queue(self, name: str, *, ensure: bool = True) -> MemoryQueue:
+        return MemoryQueue(self, self.broker.queue(name))
+
+    async def close(self):
+        for task in self.consumers.values():
+            task.cancel()
+        self.consumers.clear()
+        self.is_closed = True
+
+class MemoryTransport(Transport):
+    name = "memory"
+
+    def __init__(self, broker: Optional[MemoryBroker] = None):
+        self.broker = broker or MemoryBroker()
+
+    async def connect(self, url: str = None):
+        return await self.broker.connect(url)
+
+_TRANSPORTS = {transport.name: transport for transport in (AMQPTransport, MemoryTransport)}
+_instances: Dict[str, Transport] = {}
+
+def get_transport(name: str) -> Transport:
+    """Returns the process-wide transport, so every connection shares one memory broker."""
+    transport = _instances.get(name)
+    if transport is None:
+        if name not in _TRANSPORTS:
+            raise ValueError(f"Unknown transport: {name}")
+        transport = _instances[name] = _TRANSPORTS[name]()
+    return transport
@@ -1,59 +1,122 @@
+import asyncio
+from contextlib import suppress
+
 from fastapi import FastAPI, Depends
-from starlette.middleware.base import BaseHTTPMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse
 
-from producer.core.rabbitmq import rabbitmq_manager
-from producer.core.exceptions import ValidationError, UnauthorizedError
+from producer.core.rabbitmq import get_rabbitmq_manager
+from producer.core.metrics import (
+    MetricsMiddleware,
+    log_suppressed,
+    registry,
+    rpc_circuit_state,
+    rpc_coalesced,
+    rpc_in_flight,
+    rpc_queue_depth,
+    token_cache_lookups
+)
+from producer.core.middleware import AuthMiddleware
+from producer.core.log import setup_logging, suppressed_records
+from producer.core.resources import resources
 from producer.src.user.routers.auth import router as auth_router
-from producer.utils.security import verify_token
+from producer.utils.security import get_token_cache
+from producer.utils.redis import get_revoked_filter
+from producer.core.config import settings
 
 # dev only
-from producer.core.dependencies import oauth2_scheme
+from producer.core.dependencies import configure_oauth2_scheme, internal_only, oauth2_scheme
 
 app = FastAPI()
 
-class Middleware(BaseHTTPMiddleware):
-    async def dispatch(self, request, call_next):
-        public_paths = ["/docs", "/openapi.json", "/redoc", "/auth/login", "/auth/register"]
-
-        if any(request.url.path.startswith(path) for path in public_paths):
-            return await call_next(request)
-        
-        try:
-            auth_header = request.headers.get("Authorization")
-            if not auth_header or not auth_header.startswith("Bearer "):
-                raise UnauthorizedError("Missing or invalid Authorization header")
-            
-            token = auth_header.split(" ")[1]
-            payload = verify_token(token)
-
-            request.state.token_payload = payload
-
-            response = await call_next(request)
-            return response
-        
-        except Exception as e:
-            raise ValidationError(str(e))
-
 #Routers
 app.include_router(auth_router)
 
 #Middleware
-app.add_middleware(Middleware)
+app.add_middleware(AuthMiddleware)
+app.add_middleware(MetricsMiddleware)
+
+#Metrics read at scrape time
+rpc_in_flight.set_function(lambda: len(get_rabbitmq_manager().futures))
+rpc_coalesced.set_function(lambda: {
+    ("sent",): get_rabbitmq_manager().single_flight.calls,
+    ("shared",): get_rabbitmq_manager().single_flight.shared,
+})
+rpc_queue_depth.set_function(lambda: {
+    (routing_key,): depth for routing_key, depth in get_rabbitmq_manager().admission.depths.items()
+})
+_CIRCUIT_STATES = {"closed": 0, "half_open": 1, "open": 2}
+rpc_circuit_state.set_function(lambda: {
+    (routing_key,): _CIRCUIT_STATES[state["state"]] for routing_key, state in get_rabbitmq_manager().breaker_states().items()
+})
+token_cache_lookups.set_function(lambda: {("hit",): get_token_cache().hits, ("miss",): get_token_cache().misses})
+log_suppressed.set_function(suppressed_records)
+
+@app.get("/metrics", include_in_schema=False, dependencies=[Depends(internal_only)])
+async def metrics():
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/health/live", include_in_schema=False)
+async def live():
+    return {"status": "ok"}
+
+@app.get("/health/ready", include_in_schema=False, dependencies=[Depends(internal_only)])
+async def ready():
+    # Retries whatever failed to warm up so far, e.g. a Redis that came up late.
+    # Only booleans: the reasons are logged, not handed to whoever asks
+    is_ready = await resources.warm_up(strict=False)
+    return JSONResponse(
+        {
+            "ready": is_ready,
+            "resources": {name: status["warmed"] for name, status in resources.status().items()},
+            "circuits_closed": {
+                routing_key: state["state"] == "closed" for routing_key, state in get_rabbitmq_manager().breaker_states().items()
+            },
+        },
+        status_code=200 if is_ready else 503
+    )
 
 #dev_only
 @app.get("/auth/docs-helper", include_in_schema=False)
 async def docs_helper(token: str = Depends(oauth2_scheme)):
     return {"msg": "This makes the Authorize button appear"}
 
+async def start_local_consumer():
+    # Co-located mode: the consumer shares this process and its in-memory broker
+    from consumer.consume import main as consume
+
+    ready = asyncio.Event()
+    consumer_task = app.state.consumer_task = asyncio.create_task(
+        consume(connect=get_rabbitmq_manager().transport.connect, ready=ready)
+    )
+    ready_task = asyncio.create_task(ready.wait())
+    await asyncio.wait({consumer_task, ready_task}, return_when=asyncio.FIRST_COMPLETED)
+    if consumer_task.done():
+        ready_task.cancel()
+        consumer_task.result()  # raises why the consumer could not start
+
 @app.on_event("startup")
 async def startup():
-    await rabbitmq_manager.connect()
+    # Settings are first read here, not when the app is imported
+    setup_logging()
+    configure_oauth2_scheme()
+    if settings.TRANSPORT == "memory":
+        await start_local_consumer()
+    # Connects to the broker and warms Redis and the hash executor before serving
+    await resources.warm_up()
     print("Connected to RabbitMQ")
+    if settings.BLACKLIST_FILTER_ENABLED:
+        get_revoked_filter().start()
 
 @app.on_event("shutdown")
 async def shutdown():
-    await rabbitmq_manager.close()
+    # Stops the revoked token filter, then closes Redis and the broker connection
+    await resources.close()
     print("Connection with RabbitMQ was closed")
+    consumer_task = getattr(app.state, "consumer_task", None)
+    if consumer_task is not None:
+        consumer_task.cancel()
+        with suppress(asyncio.CancelledError):
+            await consumer_task
 
 @app.get("/")
 async def read_root():
@@ -1,20 +1,23 @@
+import asyncio
 import logging
+from typing import Dict
 
 from fastapi import APIRouter, Request, Depends
 from fastapi.security import OAuth2PasswordRequestForm, HTTPAuthorizationCredentials, HTTPBearer
 
-from producer.core.rabbitmq import rabbitmq_manager
-from producer.core.exceptions import UnauthorizedError, InternalServerError
+from producer.core.config import settings
+from producer.core.rabbitmq import get_rabbitmq_manager
+from producer.core.exceptions import AppException, UnauthorizedError, InternalServerError, ServiceUnavailableError
 from producer.utils.security import (
-    hash_password,
-    verify_password,
+    get_password_hasher,
+    get_token_cache,
+    token_cache_key,
     create_access_token,
     create_refresh_token
 )
+from producer.utils.redis import blacklist_token, get_revoked_filter
 from producer.src.user.schemas.user import RegisterModel, TokenResponse
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/auth", tags=["auth"])
@@ -22,7 +25,7 @@ router = APIRouter(prefix="/auth", tags=["auth"])
 @router.post("/register", response_model=dict)
 async def register(request: Request, user: RegisterModel):
     try:
-        hashed_pwd = hash_password(user.password)
+        hashed_pwd = await get_password_hasher().hash(user.password)
 
         message = {
             "action": "register_user",
@@ -33,7 +36,7 @@ async def register(request: Request, user: RegisterModel):
             }
         }
 
-        response = await rabbitmq_manager.publish_message(
+        response = await get_rabbitmq_manager().publish_message(
             routing_key="user.register",
             message=message
         )
@@ -43,13 +46,15 @@ async def register(request: Request, user: RegisterModel):
             
         return response
 
+    except ServiceUnavailableError:
+        raise
     except Exception as e:
         raise InternalServerError(f"Registration error: {str(e)}")
 
 @router.post("/login", response_model=TokenResponse)
 async def login(request: Request, form_data: OAuth2PasswordRequestForm = Depends()):
     try:
-        logger.info(f"Login attempt for user: {form_data.username}")
+        logger.info("Login attempt for user: %s", form_data.username)
         
         message = {
             "action": "get_user_by_username",
@@ -59,21 +64,24 @@ async def login(request: Request, form_data: OAuth2PasswordRequestForm = Depends
             }
         }
 
-        response = await rabbitmq_manager.publish_message(
+        response = await get_rabbitmq_manager().publish_message(
             routing_key="user.login",
             message=message
         )
 
         if "error" in response:
-            logger.error(f"Login error from consumer: {response['error']}")
+            logger.debug("Login error from consumer: %s", response["error"])
             raise InternalServerError(response["error"])
 
-        logger.info(f"User found in database: {response}")
-        logger.info(f"Attempting to verify password for user: {form_data.username}")
+        logger.debug("User %s found in database", response["id"])
+        logger.debug("Attempting to verify password for user: %s", form_data.username)
 
-        if not verify_password(form_data.password, response["password"]):
+        if not await get_password_hasher().verify(form_data.password, response["password"]):
             raise UnauthorizedError("Incorrect password")
 
+        if settings.PASSWORD_REHASH_ON_LOGIN and get_password_hasher().needs_update(response["password"]):
+            schedule_rehash(response, form_data.password)
+
         token_data = {
             "sub": str(response["id"]),
             "role": str(response["role"])
@@ -82,20 +90,26 @@ async def login(request: Request, form_data: OAuth2PasswordRequestForm = Depends
         access_token = create_access_token(data=token_data)
         refresh_token = create_refresh_token(data=token_data)
 
-        logger.info(f"Successful login for user: {form_data.username}")
+        logger.info("Successful login for user: %s", form_data.username)
         return {
             "access_token": access_token,
             "refresh_token": refresh_token,
             "token_type": "bearer"
         }
 
+    except ServiceUnavailableError:
+        raise
     except Exception as e:
-        logger.error(f"Login error: {str(e)}")
+        # Unknown users and wrong passwords are routine, so they stay at the rate-limited INFO
+        logger.log(logging.INFO if isinstance(e, AppException) else logging.ERROR, "Login error: %s", e)
         raise InternalServerError(f"Login error: {str(e)}")
 
 @router.post("/logout")
 async def logout(request: Request, credentials: HTTPAuthorizationCredentials = Depends(HTTPBearer())):
     try:
+        if settings.LOGOUT_MODE == "direct":
+            return await direct_logout(request, credentials.credentials)
+
         message = {
             "action": "logout_user",
             "data": {
@@ -103,16 +117,70 @@ async def logout(request: Request, credentials: HTTPAuthorizationCredentials = D
             }
         }
 
-        response = await rabbitmq_manager.publish_message(
+        response = await get_rabbitmq_manager().publish_message(
             routing_key="user.logout",
             message=message
         )
         
         if "error" in response:
             raise InternalServerError(response["error"])
-            
+
+        # The consumer revoked it in Redis; stop accepting it here right away too
+        get_revoked_filter().add(request.state.token_payload["jti"])
+        get_token_cache().pop(token_cache_key(credentials.credentials))
         return response
     
+    except ServiceUnavailableError:
+        raise
+    except Exception as e:
+        logger.error("Logout error: %s", e)
+        raise InternalServerError(f"Logout error: {str(e)}")
+
+async def direct_logout(request: Request, token: str) -> dict:
+    payload = request.state.token_payload
+    await blacklist_token(payload)
+    get_token_cache().pop(token_cache_key(token))
+
+    if settings.LOGOUT_AUDIT_EVENTS:
+        get_rabbitmq_manager().publish_event(
+            routing_key="user.logout",
+            message={
+                "action": "logout_event",
+                "data": {
+                    "sub": payload.get("sub"),
+                    "jti": payload.get("jti")
+                }
+            }
+        )
+
+    return {"success": "User logged out successfully"}
+
+# Rehashes underway in this process by user id; also keeps the tasks referenced until done
+_pending_rehashes: Dict[int, asyncio.Task] = {}
+
+def schedule_rehash(user: dict, password: str):
+    """Rehashes the password with the current cost without delaying the login."""
+    if user["id"] in _pending_rehashes:
+        return
+    task = _pending_rehashes[user["id"]] = asyncio.create_task(rehash_password(user, password))
+    task.add_done_callback(lambda _: _pending_rehashes.pop(user["id"], None))
+
+async def rehash_password(user: dict, password: str):
+    try:
+        new_hash = await get_password_hasher().hash(password)
+        # The consumer only applies it if the stored hash is still the one verified here
+        get_rabbitmq_manager().publish_event(
+            routing_key="user.login",
+            message={
+                "action": "update_password_hash",
+                "data": {
+                    "id": user["id"],
+                    "username": user["username"],
+                    "old_hash": user["password"],
+                    "new_hash": new_hash
+                }
+            },
+            priority=0
+        )
     except Exception as e:
-        logger.error(f"Logout error: {str(e)}")
-        raise InternalServerError(f"Logout error: {str(e)}")
\ No newline at end of file
+        logger.error("Error rehashing password for user %s: %s", user["id"], e)
@@ -1,13 +1,128 @@
+import asyncio
+import logging
+import time
+from typing import List, Optional
 
-import redis
+import redis.asyncio as redis
 
-redis_client = redis.Redis(host='redis', port=6379, db=0)
+from producer.core.config import settings
+from producer.core.metrics import redis_duration
+from producer.core.resources import resources
+from producer.utils.bloom import BloomFilter
 
-def is_token_blacklisted(payload):
+logger = logging.getLogger(__name__)
+
+def create_redis() -> redis.Redis:
+    pool = redis.ConnectionPool.from_url(settings.REDIS_URL, max_connections=settings.REDIS_MAX_CONNECTIONS)
+    return redis.Redis(connection_pool=pool)
+
+async def ping_redis(client: redis.Redis):
+    await client.ping()
+
+redis_resource = resources.add("redis", create_redis, warm=ping_redis, close=lambda client: client.aclose())
+
+def get_redis() -> redis.Redis:
+    return redis_resource.get()
+
+BLACKLIST_PREFIX = "blacklist:"
+
+class RevokedTokenFilter:
+    """Local Bloom filter of revoked jtis, rebuilt from Redis in the background.
+
+    A jti that is not in the filter was not revoked as of the last sync, so it
+    needs no Redis lookup. Until the first sync succeeds (or after a failed
+    one) every jti is reported as a possible member.
+    """
+    def __init__(self, capacity: int, error_rate: float, interval: float):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.interval = interval
+        self.ready = False
+        self._filter = BloomFilter(capacity, error_rate)
+        # jtis added while a sync is scanning, copied into the filter it builds
+        self._added_during_sync: Optional[List[str]] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def add(self, jti: str):
+        self._filter.add(jti)
+        if self._added_during_sync is not None:
+            self._added_during_sync.append(jti)
+
+    def might_contain(self, jti: str) -> bool:
+        return not self.ready or jti in self._filter
+
+    async def sync(self):
+        start = time.perf_counter()
+        self._added_during_sync = added = []
+        try:
+            jtis = [
+                key.decode()[len(BLACKLIST_PREFIX):]
+                async for key in get_redis().scan_iter(match=f"{BLACKLIST_PREFIX}*", count=1000)
+            ]
+        finally:
+            self._added_during_sync = None
+        redis_duration.observe(time.perf_counter() - start, "scan")
+        # The scan may have passed a key before it was written; nothing awaits from here on
+        bloom = BloomFilter(max(self.capacity, (len(jtis) + len(added)) * 2), self.error_rate)
+        for jti in jtis + added:
+            bloom.add(jti)
+        self._filter = bloom
+        self.ready = True
+
+    async def _run(self):
+        while True:
+            try:
+                await self.sync()
+            except Exception as e:
+                self.ready = False
+                logger.error("Error syncing revoked token filter: %s", e)
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+def create_revoked_filter() -> RevokedTokenFilter:
+    return RevokedTokenFilter(
+        settings.BLACKLIST_FILTER_CAPACITY,
+        settings.BLACKLIST_FILTER_ERROR_RATE,
+        settings.BLACKLIST_SYNC_INTERVAL_SECONDS
+    )
+
+# Started by the startup hook when BLACKLIST_FILTER_ENABLED; stopped before Redis closes
+revoked_filter_resource = resources.add("revoked_filter", create_revoked_filter, close=lambda f: f.stop())
+
+def get_revoked_filter() -> RevokedTokenFilter:
+    return revoked_filter_resource.get()
+
+async def is_token_blacklisted(payload):
+    jti = payload.get("jti")
+    if settings.BLACKLIST_FILTER_ENABLED and not get_revoked_filter().might_contain(jti):
+        return False
+    start = time.perf_counter()
     try:
-        jti = payload.get("jti")
         # Check if the jti exists in Redis
-        return redis_client.exists(f"blacklist:{jti}") == 1
+        return await get_redis().exists(f"{BLACKLIST_PREFIX}{jti}") == 1
     except Exception as e:
-        print(f"Error verifying token blacklist: {e}")
-        return True
\ No newline at end of file
+        logger.error("Error verifying token blacklist: %s", e)
+        return not settings.BLACKLIST_FAIL_OPEN
+    finally:
+        redis_duration.observe(time.perf_counter() - start, "exists")
+
+async def blacklist_token(payload):
+    jti = payload.get("jti")
+    exp_timestamp = payload.get("exp")
+    if jti is None or exp_timestamp is None:
+        raise ValueError("Token does not contain required jti or exp claim")
+
+    ttl = int(exp_timestamp - time.time())
+    if ttl > 0:
+        start = time.perf_counter()
+        await get_redis().setex(f"{BLACKLIST_PREFIX}{jti}", ttl, "true")
+        redis_duration.observe(time.perf_counter() - start, "setex")
+        get_revoked_filter().add(jti)
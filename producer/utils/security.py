@@ -1,3 +1,8 @@
+import asyncio
+import hashlib
+import time
+from functools import lru_cache
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
 from passlib.context import CryptContext
 from datetime import datetime, timedelta
 from typing import Optional
@@ -5,15 +10,87 @@ from jose import JWTError, jwt
 import uuid
 from producer.core.config import settings
 from producer.core.exceptions import UnauthorizedError
+from producer.core.metrics import password_hash_duration
+from producer.core.resources import resources
+from common.cache import TTLCache
 from producer.utils.redis import is_token_blacklisted
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+@lru_cache
+def get_pwd_context() -> CryptContext:
+    # Also built on first use in each worker process of the "process" hash mode
+    return CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=settings.BCRYPT_ROUNDS)
 
 def hash_password(password: str) -> str:
-    return pwd_context.hash(password)
+    return get_pwd_context().hash(password)
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+    return get_pwd_context().verify(plain_password, hashed_password)
+
+class PasswordHasher:
+    """Runs bcrypt hashing and verification off the event loop.
+
+    Modes: ``inline`` calls bcrypt directly on the loop, ``thread`` uses a
+    thread pool (bcrypt releases the GIL) and ``process`` uses a process pool.
+    """
+    MODES = ("inline", "thread", "process")
+
+    def __init__(self, mode: str = "thread", workers: int = 4):
+        if mode not in self.MODES:
+            raise ValueError(f"Unknown password hash mode: {mode}")
+        self.mode = mode
+        self.workers = workers
+        self._executor: Optional[Executor] = None
+
+    def _get_executor(self) -> Optional[Executor]:
+        if self.mode == "inline":
+            return None
+        if self._executor is None:
+            if self.mode == "thread":
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="bcrypt")
+            else:
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        return self._executor
+
+    async def _run(self, operation: str, fn, *args):
+        start = time.perf_counter()
+        try:
+            executor = self._get_executor()
+            if executor is None:
+                return fn(*args)
+            return await asyncio.get_running_loop().run_in_executor(executor, fn, *args)
+        finally:
+            password_hash_duration.observe(time.perf_counter() - start, operation)
+
+    async def hash(self, password: str) -> str:
+        return await self._run("hash", hash_password, password)
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        return await self._run("verify", verify_password, plain_password, hashed_password)
+
+    def needs_update(self, hashed_password: str) -> bool:
+        """True if the hash uses another cost than BCRYPT_ROUNDS; parses the hash only."""
+        return get_pwd_context().needs_update(hashed_password)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+# Cost 4, so verifying it only loads the bcrypt backend and starts the executor
+WARM_UP_HASH = "$2b$04$j6kKleJSyt0HQV0elNJBiOPGItdy2W.bfo02uzJUF9.qUkTcy37Qy"
+
+async def warm_password_hasher(hasher: PasswordHasher):
+    await hasher.verify("warm-up", WARM_UP_HASH)
+
+password_hasher_resource = resources.add(
+    "password_hasher",
+    lambda: PasswordHasher(settings.PASSWORD_HASH_MODE, settings.PASSWORD_HASH_WORKERS),
+    warm=warm_password_hasher,
+    close=lambda hasher: hasher.shutdown()
+)
+
+def get_password_hasher() -> PasswordHasher:
+    return password_hasher_resource.get()
 
 def create_access_token(data: dict, expires_delta: timedelta = None) -> str:
     to_encode = data.copy()
@@ -37,10 +114,33 @@ def create_refresh_token(data: dict) -> str:
     encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
     return encoded_jwt
 
-def verify_token(token: str) -> dict:
+# Verified payloads keyed by token digest
+token_cache_resource = resources.add(
+    "token_cache",
+    lambda: TTLCache(settings.TOKEN_CACHE_SIZE, settings.TOKEN_CACHE_TTL_SECONDS)
+)
+
+def get_token_cache() -> TTLCache:
+    return token_cache_resource.get()
+
+def token_cache_key(token: str) -> bytes:
+    return hashlib.sha256(token.encode()).digest()
+
+async def verify_token(token: str) -> dict:
+    cache_key = token_cache_key(token)
+    token_cache = get_token_cache()
+    payload = token_cache.get(cache_key)
+    if payload is not None:
+        return payload
+
     try:
         payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
-        if (is_token_blacklisted(payload)): raise UnauthorizedError("Token has revoked")
+        # A token without a jti could never be revoked
+        if not isinstance(payload.get("jti"), str): raise UnauthorizedError("Could not validate credentials")
+        if (await is_token_blacklisted(payload)): raise UnauthorizedError("Token has revoked")
+        # Never keep a payload past the token's own expiry
+        if payload.get("exp") is not None:
+            token_cache.set(cache_key, payload, payload["exp"] - time.time())
         return payload
 
     except jwt.ExpiredSignatureError:
@@ -0,0 +1,9 @@
+import os
+import tempfile
+
+# The services read their settings at import time
+_workdir = tempfile.mkdtemp(prefix="tests-")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{_workdir}/tests.db")
+os.environ.setdefault("SECRET_KEY", "tests")
+os.environ.setdefault("ALGORITHM", "HS256")
+os.environ.setdefault("CONSUMER_METRICS_DIR", f"{_workdir}/metrics")
@@ -0,0 +1,37 @@
+import asyncio
+
+import pytest
+
+from consumer.core.batching import MicroBatcher
+
+@pytest.mark.asyncio
+async def test_items_are_flushed_together():
+    batches = []
+
+    async def flush(items):
+        batches.append(items)
+        return [item * 2 for item in items]
+
+    batcher = MicroBatcher(flush, max_size=3, window=1)
+    results = await asyncio.gather(*(batcher.submit(item) for item in (1, 2, 3)))
+
+    assert results == [2, 4, 6]
+    assert batches == [[1, 2, 3]]
+    assert not batcher._tasks
+
+@pytest.mark.asyncio
+async def test_failed_batch_is_retried_item_by_item():
+    async def flush(items):
+        if "bad" in items:
+            raise ValueError("bad item")
+        return [item.upper() for item in items]
+
+    batcher = MicroBatcher(flush, max_size=3, window=1)
+    results = await asyncio.gather(
+        *(batcher.submit(item) for item in ("a", "bad", "c")),
+        return_exceptions=True
+    )
+
+    assert results[0] == "A"
+    assert isinstance(results[1], ValueError)
+    assert results[2] == "C"
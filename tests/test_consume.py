@@ -0,0 +1,32 @@
+import aio_pika
+import pytest
+
+from consumer import consume
+from producer.core.transport import MemoryTransport
+
+@pytest.mark.asyncio
+async def test_shared_lane_redeclares_an_existing_shared_queue(monkeypatch):
+    transport = MemoryTransport()
+    connection = await transport.connect()
+    # The shared queue as older releases declared it, with no arguments
+    channel = await connection.channel()
+    await channel.declare_queue(consume.SHARED_QUEUE, durable=True)
+
+    monkeypatch.setattr(consume, "QUEUE_LAYOUT", "shared")
+    for lane in consume.build_lanes():
+        await lane.declare(connection)
+        assert not lane.channel.is_closed
+
+    with pytest.raises(aio_pika.exceptions.ChannelPreconditionFailed):
+        await (await connection.channel()).declare_queue(
+            consume.SHARED_QUEUE, durable=True, arguments={"x-max-priority": 10}
+        )
+
+def test_only_per_action_queues_carry_priorities(monkeypatch):
+    monkeypatch.setattr(consume, "QUEUE_LAYOUT", "per_action")
+    monkeypatch.setattr(consume, "QUEUE_MAX_PRIORITY", 10)
+
+    lanes = consume.build_lanes()
+
+    assert lanes and all(lane.arguments == {"x-max-priority": 10} for lane in lanes)
+    assert consume.SHARED_QUEUE not in {lane.name for lane in lanes}
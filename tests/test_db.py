@@ -0,0 +1,51 @@
+import asyncio
+import time
+
+import pytest
+from sqlalchemy import text
+
+from consumer.core.db import DB_POOL_SIZE, pool_stats, run_in_connection, run_in_session
+
+QUERY_SECONDS = 0.2
+
+def slow_lookup(db, seconds):
+    # Stands in for a query that holds its connection while the database works
+    time.sleep(seconds)
+    return db.execute(text("SELECT 1")).scalar()
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("run", [run_in_session, run_in_connection])
+async def test_concurrent_lookups_overlap(run):
+    assert DB_POOL_SIZE >= 2
+    start = time.perf_counter()
+    results = await asyncio.gather(run(slow_lookup, QUERY_SECONDS), run(slow_lookup, QUERY_SECONDS))
+    elapsed = time.perf_counter() - start
+
+    assert results == [1, 1]
+    assert elapsed < 2 * QUERY_SECONDS * 0.9
+
+@pytest.mark.asyncio
+async def test_lookup_does_not_block_event_loop():
+    ticks = 0
+
+    async def tick():
+        nonlocal ticks
+        while True:
+            ticks += 1
+            await asyncio.sleep(0.01)
+
+    ticker = asyncio.create_task(tick())
+    await run_in_session(slow_lookup, QUERY_SECONDS)
+    ticker.cancel()
+
+    assert ticks >= 5
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("run", [run_in_session, run_in_connection])
+async def test_checkout_wait_is_recorded(run):
+    before = pool_stats()["checkouts"]
+    await run(slow_lookup, 0)
+    stats = pool_stats()
+
+    assert stats["checkouts"] == before + 1
+    assert stats["checkout_wait_seconds"] > 0
@@ -0,0 +1,14 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+@pytest.mark.parametrize("module", [
+    "producer.core.rabbitmq", "producer.utils.security", "producer.utils.redis", "producer.main"
+])
+def test_import_does_not_read_settings(module):
+    env = {name: value for name, value in os.environ.items() if name not in ("SECRET_KEY", "ALGORITHM")}
+    code = f"import {module}; from producer.core.config import get_settings; assert get_settings.cache_info().currsize == 0"
+    result = subprocess.run([sys.executable, "-c", code], env=env, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr[-2000:]
@@ -0,0 +1,23 @@
+import io
+import logging
+
+from common.log import setup_logging, stop_logging, suppressed_records
+
+def test_info_records_are_rate_limited_per_event():
+    stream = io.StringIO()
+    # Start from scratch in case an imported service already configured logging
+    stop_logging()
+    setup_logging("INFO", rate_limit=1, queued=False, stream=stream)
+    try:
+        logger = logging.getLogger("tests.log")
+        for i in range(5):
+            logger.info("Login error: %s", i)
+            logger.error("Unexpected error: %s", i)
+        lines = stream.getvalue().splitlines()
+
+        assert sum("Login error" in line for line in lines) == 1
+        assert sum("Unexpected error" in line for line in lines) == 5
+        assert suppressed_records() == 4
+    finally:
+        stop_logging()
+    assert suppressed_records() == 0
@@ -0,0 +1,31 @@
+import asyncio
+
+import aio_pika
+import pytest
+
+from producer.core.rabbitmq import RabbitMQManager, ServiceUnavailableError
+from producer.core.transport import MemoryTransport
+
+@pytest.mark.asyncio
+async def test_returns_are_dropped_without_publisher_confirms():
+    connection = await MemoryTransport().connect()
+    returned = []
+    for publisher_confirms in (False, True):
+        channel = await connection.channel(publisher_confirms=publisher_confirms)
+        channel.return_callbacks.add(lambda channel, message: returned.append(publisher_confirms))
+        exchange = await channel.declare_exchange("rpc", aio_pika.ExchangeType.DIRECT)
+        await exchange.publish(aio_pika.Message(body=b"{}"), routing_key="nobody", mandatory=True)
+
+    assert returned == [True]
+
+@pytest.mark.asyncio
+async def test_unroutable_request_fails_before_its_timeout():
+    manager = RabbitMQManager(transport="memory", direct_reply_to=False, breaker_enabled=False)
+    manager.transport = MemoryTransport()
+    await manager.connect()
+    try:
+        assert all(channel.publisher_confirms for channel, _ in manager._publishers)
+        with pytest.raises(ServiceUnavailableError):
+            await asyncio.wait_for(manager.publish_message("user.login", {"action": "login"}, timeout=30), 1)
+    finally:
+        await manager.close()